@@ -11,6 +11,7 @@ from src.core.algorithms.arules.mba_model import MbaModel
 from src.core.base.base_analysis import AnalysisBase
 from src.core.data_extraction.data_grouper import DataGrouper
 from src.core.io import config as hc
+from src.core.io.render_queue import RenderPolicy
 
 class Save(Enum):
     '''where to draw results from'''
@@ -32,6 +33,7 @@ class Analysis(AnalysisBase):
         no_to_save: int = 10
         save_from: Save = Save.SAVE_X_FROM_COMPONENT_OF_INTEREST
         provider_header: str = hc.PR_ID
+        render_policy: RenderPolicy = None
 
     @dataclass
     class ProviderMbaInfo:
@@ -244,7 +246,7 @@ class Analysis(AnalysisBase):
         rp = self.required_params
         data = self.data
 
-        self.mba = MbaModel(self.logger, self.code_converter, rp.filters)
+        self.mba = MbaModel(self.logger, self.code_converter, rp.filters, rp.render_policy)
         all_unique_items = [str(x) for x in data[hc.ITEM].unique().tolist()]
         grouped_data = DataGrouper(self.logger, data, hc.ITEM, hc.PAT_ID, rp.provider_header)
         documents = grouped_data.create_documents()
@@ -288,12 +290,13 @@ class Analysis(AnalysisBase):
                                               min_support=rp.provider_min_support,
                                               min_support_count=0)
             info = self.process_provider_data(gl_typical_model, provider, provider_model, group, counts)
-            labeller.label_provider(info)
             ranked_provider_info[provider] = info
             for prov_item in info.typical_provider_items:
                 sus_item_count = sus_items.get(prov_item, 0) + 1
                 sus_items[prov_item] = sus_item_count
 
+        labeller.label_providers(ranked_provider_info.values())
+
         self.log("Finding item cooccurences by component")
         component_item_occurences = []
         for component in tqdm(range(len(labeller.components))):
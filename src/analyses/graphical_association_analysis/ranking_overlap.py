@@ -1,9 +1,10 @@
 '''Check rank differences'''
 from dataclasses import dataclass
+import hashlib
 import pickle
 import pandas as pd
 from overrides import overrides
-from src.core.algorithms.similarity import rbo_with_ties
+from src.core.algorithms.similarity import TiedRanking, get_unchanged_similarities, rbo_with_ties, similarity_matrix
 from src.core.base.base_analysis import AnalysisBase
 
 class Analysis(AnalysisBase):
@@ -13,6 +14,7 @@ class Analysis(AnalysisBase):
         '''Parameters required for the analysis'''
         rank_weighting: float = 0.9
         code_of_interest: str = "49318"
+        n_processes: int = 4
 
     def __init__(self, logger, params, year):
         self.FINAL_COLS = []
@@ -28,41 +30,53 @@ class Analysis(AnalysisBase):
         rankings = []
         order = []
         scores = []
+        versions = {}
         for f in files:
             with open(f, 'rb') as g:
-                df = pickle.load(g)
+                content = g.read()
+                versions[f.name] = hashlib.sha256(content).hexdigest()
+                df = pickle.loads(content)
                 order.append(f.name)
-                providers= []
                 scores.append(df["count"].values.tolist())
-                current_score = df["count"].values.tolist()[0]
-                current_providers = []
-                # create rankings with ties as list of lists; see rbo_with_ties unit test
-                for count, prov in df.values.tolist():
-                    if count != current_score:
-                        providers.append(current_providers)
-                        for _ in range(len(current_providers) - 1):
-                            providers.append([])
-
-                        current_providers = []
-                        current_score = count
-
-                    current_providers.append(prov)
-
-                providers.append(current_providers)
-                for _ in range(len(current_providers) - 1):
-                    providers.append([])
-
+                # files are already in rank order
+                providers = TiedRanking.from_series(pd.Series(df["count"].values, index=df.iloc[:, 1].values), sort=False)
                 assert len(providers) == len(df)
                 rankings.append(providers)
 
         descriptions = []
         sensitivities = []
-        for i, S in enumerate(rankings):
+        for i, _ in enumerate(rankings):
             descriptions.append(pd.Series(scores[i]).describe())
             sensitivities.append(order[i][-8:-4])
-            for j, T in enumerate(rankings):
-                similarity = rbo_with_ties(S, T, self.required_params.rank_weighting)
-                self.log(f"RBO between {order[i]} and {order[j]}: {similarity}")
+
+        # similarities from earlier runs are reused, so only new or regenerated suspicion matrices are compared
+        rp = self.required_params
+        matrix_file = self.get_project_root() / f"data/rbo_matrix_{rp.code_of_interest}_{rp.rank_weighting}.pkl"
+        cache = pd.read_pickle(matrix_file) if matrix_file.is_file() else None
+        if isinstance(cache, dict):
+            previous, previous_versions = get_unchanged_similarities(cache["matrix"], cache["versions"], versions)
+            n_changed = len(cache["matrix"]) - len(previous)
+            if n_changed:
+                self.log(f"Recomputing similarities for {n_changed} changed suspicion matrices")
+        else:
+            # caches saved without file hashes cannot be checked, so are recomputed
+            previous, previous_versions = None, {}
+
+        similarities = similarity_matrix(rankings,
+                                         labels=order,
+                                         similarity=rbo_with_ties,
+                                         n_processes=rp.n_processes,
+                                         previous=previous,
+                                         p=rp.rank_weighting)
+        if previous is not None:
+            similarities = similarities.combine_first(previous)
+
+        pd.to_pickle({"matrix": similarities, "versions": {**previous_versions, **versions}}, matrix_file)
+        for i, name in enumerate(order):
+            for other in order[i:]:
+                self.log(f"RBO between {name} and {other}: {similarities.at[name, other]}")
+
+        similarities.loc[order, order].to_csv(self.logger.get_file_path("rbo_matrix.csv"))
 
         sensitivities, descriptions = zip(*sorted(zip(sensitivities, descriptions)))
         df = pd.DataFrame(descriptions).transpose()
@@ -39,22 +39,12 @@ class Analysis(AnalysisBase):
         '''get the cost of items in each state'''
         supp = self.required_params.min_support
         for i, state in enumerate(state_sets):
-            total_cost = 0
             name = f"costs_for_state_{self.code_converter.convert_state_num(state_order[i])}_supp_{supp}.csv"
             filename = self.logger.get_file_path(name)
-            with open(filename, 'w+') as f:
-                f.write(
-                    "Group,Category,Sub-Category,Item,Description,Cost,FeeType\r\n")
-                for item in state:
-                    code = item.split('\n')[-1]
-                    line = ','.join(self.code_converter.get_mbs_code_as_line(code))
-                    item_cost, fee_type = self.code_converter.get_mbs_item_fee(code)
-                    total_cost += item_cost
-                    item_cost = "${:.2f}".format(item_cost)
-                    f.write(f"{line},{item_cost},{fee_type}\r\n")
-
-                total_cost_str = "${:.2f}".format(total_cost)
-                self.log(f"Cost for {self.code_converter.convert_state_num(state_order[i])}: {total_cost_str}")
+            codes = [item.split('\n')[-1] for item in state]
+            report = self.code_converter.write_mbs_code_report(codes, filename)
+            total_cost_str = "${:.2f}".format(report["Cost"].sum())
+            self.log(f"Cost for {self.code_converter.convert_state_num(state_order[i])}: {total_cost_str}")
 
     def get_differences(self, state_sets):
         '''get item differences between states and write to file'''
@@ -123,10 +113,10 @@ class Analysis(AnalysisBase):
         diffs = self.get_differences(state_sets)
 
         self.log("Similarities")
-        sames_df = pd.Series([self.code_converter.get_mbs_item_fee(x)[0] for x in sames])
+        sames_df = self.code_converter.get_mbs_item_fees(list(sames))["Fee"].reset_index(drop=True)
         self.pickle_data(sames_df, f"sames_{rp.code_of_interest}_{rp.min_support}", True)
         self.log(sames_df.describe())
         self.log("Differences")
-        diff_df = pd.Series([self.code_converter.get_mbs_item_fee(x)[0] for x in diffs])
+        diff_df = self.code_converter.get_mbs_item_fees(diffs)["Fee"].reset_index(drop=True)
         self.pickle_data(diff_df, f"diffs_{rp.code_of_interest}_{rp.min_support}", True)
         self.log(diff_df.describe())
@@ -23,6 +23,6 @@ class DataExtraction(DataExtractionBase):
 
         data[hc.PR_ID] = data[hc.PR_ID].astype(str)
         data[hc.COST] = data[hc.COST].astype(float)
-        data["Header"] = data[hc.ITEM].apply(lambda x: self.code_converter.convert_mbs_code_to_ontology_label(x))
+        data["Header"] = analysis.code_converter.convert_mbs_codes_to_ontology_labels(data[hc.ITEM])
 
         return data
\ No newline at end of file
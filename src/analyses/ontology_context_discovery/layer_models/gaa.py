@@ -23,8 +23,9 @@ class GaaRoles(AbstractLayerModel):
         s.components = sorted_components
         log(s.components)
         s.role_data = {r: Role(r) for r in range(len(s.components) + 1)}
+        component_index = test_case.graphs.create_component_index(s.components)
         for i, ep in enumerate(s.episodes):
             d = {x: {} for x in ep}
-            role = test_case.graphs.identify_closest_component(s.components, d)
+            role = test_case.graphs.identify_closest_component(s.components, d, component_index)
             s.roles.append(role)
             s.role_data[role].fees.append(s.fees[i])
@@ -5,7 +5,7 @@ from pathlib import Path
 import pandas as pd
 from overrides import overrides
 from tqdm import tqdm
-from src.core.algorithms.similarity import convert_series_to_tied_list, rbo_with_ties
+from src.core.algorithms.similarity import TiedRanking, rbo_with_ties
 from src.core.base.base_analysis import AnalysisBase
 import src.core.io.config as hc
 
@@ -33,7 +33,7 @@ class Analysis(AnalysisBase):
         scores = scores["WeightedMedian"].astype(float)
         sorted_weighted_rank = scores.sort_values(ascending=False)
 
-        return convert_series_to_tied_list(sorted_weighted_rank)
+        return TiedRanking.from_series(sorted_weighted_rank)
 
     @overrides
     def run_test(self) -> None:
@@ -9,7 +9,7 @@ import pingouin as pg
 from math import isclose
 from overrides import overrides
 from tqdm import tqdm
-from src.core.algorithms.similarity import convert_series_to_tied_list, average_overlap, rbo_with_ties
+from src.core.algorithms.similarity import TiedRanking, average_overlap, rbo_with_ties
 from src.core.base.base_analysis import AnalysisBase
 import src.core.io.config as hc
 
@@ -94,7 +94,7 @@ class Analysis(AnalysisBase):
         pg.intraclass_corr(melt, targets='variable', raters='index', ratings='log').to_csv(path)
 
 
-        ranks = [convert_series_to_tied_list(x) for x in tqdm(scores)]
+        ranks = [TiedRanking.from_series(x) for x in tqdm(scores)]
         # ranks = [x["WeightedMedian"].index.tolist() for x in tqdm(scores)]
         rbos = []
         for a, b in tqdm(combinations(ranks, 2)):
@@ -14,7 +14,7 @@ class DataExtraction(DataExtractionBase):
         data = self.try_load_data(analysis, path)
         if data is not None:
             cdv = analysis.code_converter
-            codes = cdv.get_mbs_items_in_subgroup(3, 'T2', 5)
+            codes = sorted(cdv.get_mbs_items_in_subgroup(3, 'T2', 5)) # spark isin needs a list, not a frozenset
             min_date = datetime(analysis.start_year,1,1)
             max_date = datetime(analysis.end_year,12,31)
             event_type = MbsExtractTypes.AllPatient
@@ -2,6 +2,8 @@
 import multiprocessing as mp
 from dataclasses import dataclass
 from datetime import timedelta
+from functools import partial
+from pathlib import Path
 from statistics import median
 import numpy as np
 import pandas as pd
@@ -9,6 +11,7 @@ from overrides import overrides
 from tqdm import tqdm
 from src.core.algorithms.sequence.merger import MergeParameters
 from src.analyses.sequence_detection.shared.containers import LppPatient, PatientLocalPatterns
+from src.analyses.sequence_detection.shared.lpp_shards import LppShardStore
 from src.analyses.sequence_detection.shared.provider_info import get_ontology_information
 from src.analyses.sequence_detection.shared.patient_interaction import PatientConverter
 from src.core.base.base_analysis import AnalysisBase
@@ -29,6 +32,7 @@ class Analysis(AnalysisBase):
         drop_no_initiator: bool = True
         patient_lpp_location: str = None
         n_processes: int = 5
+        patients_per_batch: int = 200
 
     def __init__(self, logger, details, year):
         super().__init__(logger, details, year)
@@ -47,41 +51,52 @@ class Analysis(AnalysisBase):
 
         return course_merge_parameters
 
-    def parallel_lpp(self, arg):
-        patient_id, patient_data = arg
-        patient_lpp = PatientLocalPatterns(patient_id, patient_data, self.course_parameters)
-
-        return patient_lpp
-
-    def parallel_patients(self, patient_lpp):
-        patient = LppPatient(patient_lpp, self.codes_of_interest)
-
-        return patient
-
     @overrides
     def run_test(self) -> None:
         self.log("Running test")
         rp = self.required_params
         data = self.data
 
-        lpp_filename = "patient_lpps.pkl"
-        pool = mp.Pool(rp.n_processes)
-        if rp.patient_lpp_location is None:
-            self.log("Learning local periodic patterns")
+        # shards are saved in the output folder, or resumed or reused from the output folder of a previous run
+        lpp_folder = self.logger.get_file_path("") if rp.patient_lpp_location is None else rp.patient_lpp_location
+        store = LppShardStore(Path(lpp_folder) / "patient_lpps")
+        legacy_file = None
+        if store.manifest is None and rp.patient_lpp_location is not None:
+            legacy_file = LppShardStore.find_legacy_file(lpp_folder)
+
+        if legacy_file is not None:
+            self.log(f"Loading local patterns from {legacy_file}, saved without a record of their patients or parameters")
+            shards = [self.unpickle_data(legacy_file, check_data_folder=False)]
+        else:
             oncology = get_ontology_information(data, self.code_converter, rp.ontology_of_interest)
             oncology_providers = oncology[hc.PR_ID].unique().tolist()
             oncology_provider_data = data[data[hc.PR_ID].isin(oncology_providers)]
-            patient_lpps = pool.map(self.parallel_lpp, oncology_provider_data.groupby(hc.PAT_ID)) # only care about claims from the oncologists
-            self.pickle_data(patient_lpps, lpp_filename)
-        else:
-            file_location = f"{rp.patient_lpp_location}/{lpp_filename}"
-            patient_lpps = self.unpickle_data(file_location, check_data_folder=False)
+            patients = list(oncology_provider_data.groupby(hc.PAT_ID)) # only care about claims from the oncologists
+            key = LppShardStore.create_key([x for x, _ in patients], self.course_parameters, rp.patients_per_batch)
+            # a store from another run is refused before its shards are used or added to
+            finished = store.prepare(key)
+            if not store.is_complete():
+                self.log("Learning local periodic patterns")
+                if finished:
+                    self.log(f"Resuming with {len(finished)} of {store.manifest['n_chunks']} patient chunks already mined")
+
+                chunks = PatientLocalPatterns.iterate_parallel(patients, self.course_parameters, rp.n_processes,
+                                                               patients_per_chunk=rp.patients_per_batch, skip_chunks=finished)
+                for start, patient_lpps in tqdm(chunks, total=store.manifest["n_chunks"] - len(finished)):
+                    store.write_shard(start, patient_lpps)
+
+            shards = store.iterate_shards()
 
         self.log("Combining initiators")
-        patients = pool.map(self.parallel_patients, patient_lpps)
-        pool.close()
-        pool.join()
+        # a partial of the class pickles only the codes of interest, not the analysis and its data
+        create_patient = partial(LppPatient, codes_of_interest=self.codes_of_interest)
+        courses = []
+        with mp.Pool(rp.n_processes) as pool:
+            for patient_lpps in shards:
+                chunksize = max(1, len(patient_lpps) // (4 * rp.n_processes))
+                for patient in pool.imap(create_patient, patient_lpps, chunksize=chunksize):
+                    if patient.courses is not None:
+                        courses.extend(patient.courses)
+
         self.log("Saving data")
-        patients = [x for x in patients if x.courses is not None]
-        courses = [x for patient in patients for x in patient.courses]
         self.pickle_data(courses, "courses")
@@ -86,16 +86,19 @@ class Analysis(AnalysisBase):
             return
 
         n_per_provider = [len(x) for x in provider_courses.values()]
-        provider_results = []
-        for provider, courses in tqdm(provider_courses.items()):
+        provider_jobs = []
+        for provider, courses in provider_courses.items():
             n_courses = len(courses)
             if n_courses < skip:
                 continue
 
             minsup = max(round(100 * 3 / n_courses, 1), round(100 * self.required_params.support, 1))
             params = [f"{minsup}%"] + self.args
-            provider_result = ProviderCourseRules(provider, course_grouping, courses, params)
-            provider_results.append(provider_result)
+            provider_jobs.append((provider, courses, params))
+
+        self.log(f"Mining rules for {len(provider_jobs)} providers in the {course_grouping} group")
+        provider_results = ProviderCourseRules.create_batch(course_grouping, provider_jobs)
+        self.log(f"Finished mining rules for the {course_grouping} group")
 
         valid_results = len(provider_results)
         total_results = len(provider_courses)
@@ -46,7 +46,7 @@ class Analysis(AnalysisBase):
         total_courses = len(context_courses)
         total_item_counts = {}
         for course in tqdm(context_courses):
-            items = set(item for day in course.item_sequence.sequence for item in day.split(' '))
+            items = set(item for day in course.item_sequence.get_day_items() for item in day)
             for item in items:
                 count = total_item_counts.get(item, 0)
                 count += 1
@@ -80,22 +80,25 @@ class Analysis(AnalysisBase):
         self.rare_items = rare_items
         self.rare_item_proportions = rare_item_proportions
 
-    def convert_rule_name_to_ontology_location(self, rule_name):
-        ont_location = []
+    def convert_rule_names_to_ontology_locations(self, rule_names):
+        '''Convert the items in each rule name to their ontology locations, converting each unique item once'''
         if self.required_params.mbs_items:
             ont_loc = self.code_converter.convert_mbs_code_to_ontology_label
         else:
             ont_loc = partial(self.code_converter.convert_pbs_code_to_atc_label, 5)
 
-        for day in rule_name.split('_'):
-            ont_day = []
-            for item in day.split(' '):
-                ont = (item)
-                ont_day.append(ont)
+        rule_names = list(rule_names)
+        items = pd.Series([item for rule_name in rule_names for day in rule_name.split('_') for item in day.split(' ')])
+        ontologies = iter(self.code_converter.convert_unique_codes(items, ont_loc).tolist())
+        ont_locations = {}
+        for rule_name in rule_names:
+            ont_location = []
+            for day in rule_name.split('_'):
+                ont_location.append(' '.join(next(ontologies) for _ in day.split(' ')))
 
-            ont_location.append(' '.join(ont_day))
+            ont_locations[rule_name] = '_'.join(ont_location)
 
-        return '_'.join(ont_location)
+        return ont_locations
 
     @overrides
     def run_test(self) -> None:
@@ -111,7 +114,6 @@ class Analysis(AnalysisBase):
 
         sequence_graphs = {}
         rule_names_by_length = {}
-        rule_ontologies = {}
         rare_item_costs = {x: get_item_fee(x)[0] for x in self.rare_items}
         for rule_name in tqdm(self.rule_quantiles):
             graph = SequenceGraph.from_rule_name(rule_name, get_item_fee)
@@ -119,7 +121,8 @@ class Analysis(AnalysisBase):
             current = rule_names_by_length.get(graph.total_items, [])
             current.append(rule_name)
             rule_names_by_length[graph.total_items] = current
-            rule_ontologies[rule_name] = self.convert_rule_name_to_ontology_location(rule_name)
+
+        rule_ontologies = self.convert_rule_names_to_ontology_locations(self.rule_quantiles)
 
         labelled_courses_by_provider = {}
         provider_costs = {}
@@ -1,20 +1,46 @@
 '''classes for holding extracted patient and episode information'''
+import numpy as np
 from src.core.algorithms.sequence.format import FormatSpmf
+from src.analyses.sequence_detection.shared.containers.sequence_graph import SequenceGraph
 import src.core.io.config as hc
 
 class CourseOfTreatment:
     '''container for extracted episode information'''
-    def __init__(self, start, end, data, identifier, providers, context, patient_id):
+    def __init__(self, start, end, data, identifier, providers, context, patient_id, item_sequence=None, ontology_sequence=None):
         self.start = start
         self.end = end
-        self.item_sequence = FormatSpmf.construct_sequence(data, identifier)
-        self.ontology_sequence = FormatSpmf.construct_sequence(data, identifier, item_id="Ontology_cat")
+        if item_sequence is None:
+            item_sequence = FormatSpmf.construct_sequence(data, identifier)
+
+        if ontology_sequence is None:
+            ontology_sequence = FormatSpmf.construct_sequence(data, identifier, item_id="Ontology_cat")
+
+        self.item_sequence = item_sequence
+        self.ontology_sequence = ontology_sequence
         self.involved_providers = providers
         self.cost = data[hc.COST].sum()
         self.item_costs = data.groupby(hc.ITEM).agg({hc.COST: 'sum'}).to_dict()[hc.COST]
         self.context = context
         self.patient_id = patient_id
 
+    @classmethod
+    def split_course_claims(cls, patient_data, date_ranges):
+        '''claims for each (start, end) date range of a patient, sorted by date,
+           with the item and ontology sequences for all ranges built together'''
+        patient_data = patient_data.sort_values(hc.DATE, kind="stable")
+        dates = patient_data[hc.DATE].values
+        bounds = [(np.searchsorted(dates, np.datetime64(start), side='left'),
+                   np.searchsorted(dates, np.datetime64(end), side='right')) for start, end in date_ranges]
+        subs = [patient_data.iloc[lo:hi] for lo, hi in bounds]
+        rows = np.concatenate([np.arange(lo, hi) for lo, hi in bounds] + [np.zeros(0, dtype=np.int64)])
+        groups = np.repeat(np.arange(len(bounds)), [hi - lo for lo, hi in bounds])
+        claims = patient_data.iloc[rows]
+        identifiers = [f"{start}_{end}" for start, end in date_ranges]
+        item_sequences = FormatSpmf.construct_sequences(claims, groups, identifiers)
+        ontology_sequences = FormatSpmf.construct_sequences(claims, groups, identifiers, item_id="Ontology_cat")
+
+        return subs, item_sequences, ontology_sequences
+
 class ExtendedCourse:
     def __init__(self, course):
         self.course = course
@@ -26,6 +52,14 @@ class ExtendedCourse:
         self.position_items = dict()
         self.replaced_rules = dict()
         self.item_costs = dict()
+        self.day_item_counts = None
+
+    def get_day_item_counts(self):
+        '''item counts for each day of the course, found once from the item codes'''
+        if self.day_item_counts is None:
+            self.day_item_counts = [SequenceGraph.count_day_items(x) for x in self.course.item_sequence.get_day_items()]
+
+        return self.day_item_counts
 
     def sum_costs_at_position(self, position):
         return sum(x for x in self.course_position_costs[position].values())
@@ -64,8 +98,7 @@ class ExtendedCourse:
         return sum(x for x in self.course_position_costs.values())
 
     def label_rare_items(self, rare_items, rare_item_costs):
-        for i, day in enumerate(self.course.item_sequence.sequence):
-            items = day.split(' ')
+        for i, items in enumerate(self.get_day_item_counts()):
             for item in items:
                 if item in rare_items:
                     self.flagged_timestamps.add(i)
@@ -74,7 +107,7 @@ class ExtendedCourse:
 
     def process_sequence_graph(self, provider, graph):
         partial_sequences = {n: 0 for n in range(graph.n_days)}
-        for i, day in enumerate(self.course.item_sequence.sequence):
+        for i, day in enumerate(self.get_day_item_counts()):
             for j in partial_sequences:
                 if not graph.rule_day_is_subset(partial_sequences[j], day):
                     partial_sequences[j] = -1
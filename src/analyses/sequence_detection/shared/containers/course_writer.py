@@ -41,7 +41,7 @@ class WriteProviderCourses:
             sheet.write(row+3, 0, "Course items", ital)
             for j, day in enumerate(sequence):
                 col = j + 1
-                tstamp = sequence_timestamps[j]
+                tstamp = int(sequence_timestamps[j])
                 date = course.course.start + timedelta(tstamp)
                 sheet.write(row+1, col, tstamp, ital)
                 sheet.write(row+2, col, date.strftime("%d-%b-%y"), ital)
@@ -15,18 +15,14 @@ class ClaimsPatient:
     @classmethod
     def extract_sub_episodes(cls, patient_data, timestamps, date_map,  patient_id):
         courses = []
-        for timestamp in timestamps:
-            start = date_map.get_date_from_timestamp(timestamp[0])
-            end = date_map.get_date_from_timestamp(timestamp[1])
-            mask = (patient_data[hc.DATE] >= start) & (patient_data[hc.DATE] <= end)
-            sub = patient_data[mask].sort_values(hc.DATE)
+        date_ranges = [(date_map.get_date_from_timestamp(x[0]), date_map.get_date_from_timestamp(x[1])) for x in timestamps]
+        subs, item_sequences, ontology_sequences = CourseOfTreatment.split_course_claims(patient_data, date_ranges)
+        for i, (start, end) in enumerate(date_ranges):
+            sub = subs[i]
             providers = sub[hc.PR_ID].unique().tolist()
-            items = set(sub[hc.ITEM].unique().tolist())
             context = "claims"
-            course = CourseOfTreatment(start, end, sub, f"{start}_{end}", providers, context, patient_id)
+            course = CourseOfTreatment(start, end, sub, f"{start}_{end}", providers, context, patient_id,
+                                       item_sequence=item_sequences[i], ontology_sequence=ontology_sequences[i])
             courses.append(course)
 
         return courses
-
-
-
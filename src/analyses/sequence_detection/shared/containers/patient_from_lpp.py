@@ -27,7 +27,7 @@ class LppPatient:
     @classmethod
     def process_initators(cls, data, timestamps, date_map, codes_of_interest, max_interval, drop_no_initiator):
         initiator_rows = data[data[hc.ITEM].isin(codes_of_interest)]
-        initiator_dates = initiator_rows[hc.DATE].apply(lambda x: date_map.get_timestamp_from_date(x)).values.tolist()
+        initiator_dates = date_map.get_timestamps_from_dates(initiator_rows[hc.DATE]).tolist()
         new_timestamps = Merger.merge_initiator(initiator_dates, timestamps, max_interval, drop_no_initiator=drop_no_initiator)
 
         return new_timestamps
@@ -35,18 +35,16 @@ class LppPatient:
     @classmethod
     def extract_sub_episodes(cls, patient_data, timestamps, date_map, initiator_codes: set, patient_id):
         courses = []
-        for timestamp in timestamps:
-            start = date_map.get_date_from_timestamp(timestamp[0])
-            end = date_map.get_date_from_timestamp(timestamp[1])
-            mask = (patient_data[hc.DATE] >= start) & (patient_data[hc.DATE] <= end)
-            sub = patient_data[mask].sort_values(hc.DATE)
+        date_ranges = [(date_map.get_date_from_timestamp(x[0]), date_map.get_date_from_timestamp(x[1])) for x in timestamps]
+        subs, item_sequences, ontology_sequences = CourseOfTreatment.split_course_claims(patient_data, date_ranges)
+        for i, (start, end) in enumerate(date_ranges):
+            sub = subs[i]
             providers = sub[hc.PR_ID].unique().tolist()
             items = set(sub[hc.ITEM].unique().tolist())
             initiator_items = initiator_codes.intersection(items)
             initiator = '_'.join(sorted(list(initiator_items)))
-            course = CourseOfTreatment(start, end, sub, f"{start}_{end}", providers, initiator, patient_id)
+            course = CourseOfTreatment(start, end, sub, f"{start}_{end}", providers, initiator, patient_id,
+                                       item_sequence=item_sequences[i], ontology_sequence=ontology_sequences[i])
             courses.append(course)
 
         return courses
-
-
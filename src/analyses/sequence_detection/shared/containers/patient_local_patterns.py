@@ -1,4 +1,7 @@
 '''classes for holding extracted patient and episode information'''
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
 from pandas import DataFrame
 from src.core.algorithms.sequence.date_map import DateMap
 from src.core.algorithms.sequence.format import FormatSpmf
@@ -6,12 +9,31 @@ from src.core.algorithms.sequence.merger import Merger, MergeParameters
 from src.core.algorithms.sequence.sequence import SequentialPatternDetection as SPD
 import src.core.io.config as hc
 
+_worker_parameters = None
+
+def set_worker_parameters(parameters):
+    '''store the merge parameters in a local pattern worker, so they are sent once per process rather than once per chunk'''
+    global _worker_parameters # pylint: disable=global-statement ## process pool initialiser
+    _worker_parameters = parameters
+
+def mine_patient_chunk(chunk):
+    '''mined and combined local patterns for a chunk of patients, each given as arrays of day itemsets and timestamps'''
+    start, episodes = chunk
+    p = _worker_parameters
+    results = SPD.mine_local_periodic_patterns_batch(episodes, p.max_period, p.min_duration, p.max_spill)
+    combined = [SPD.combine_overlapping_timestamped_patterns(x, y, tolerance=p.max_period) for x, y in results]
+
+    return start, [x + y for x, y in zip(results, combined)]
+
 class PatientLocalPatterns:
-    def __init__(self, patient_id: str, patient_data: DataFrame, parameters: MergeParameters, find_lpps=True, find_combined_patterns=True):
+    def __init__(self, patient_id: str, patient_data: DataFrame, parameters: MergeParameters, find_lpps=True, find_combined_patterns=True, sequence=None):
         self.id = patient_id
         self.data = patient_data
         self.date_map = DateMap(patient_data[hc.DATE])
-        self.seq = FormatSpmf.construct_sequence(patient_data, patient_id, date_map=self.date_map, item_id="Ontology_cat", uniques_only_in_itemset=True)
+        if sequence is None:
+            sequence = FormatSpmf.construct_sequence(patient_data, patient_id, date_map=self.date_map, item_id="Ontology_cat")
+
+        self.seq = sequence
         self.parameters = parameters
         if find_lpps:
             self.find_lpps()
@@ -25,6 +47,72 @@ class PatientLocalPatterns:
             self.final_patterns = None
             self.final_timestamps = None
 
+    @classmethod
+    def create_unmined(cls, patients, parameters: MergeParameters):
+        '''local patterns for each (patient_id, patient_data) pair without mining, with the sequences for all patients built together'''
+        if not patients:
+            return []
+
+        data = pd.concat([x for _, x in patients])
+        groups = np.repeat(np.arange(len(patients)), [len(x) for _, x in patients])
+        sequences = FormatSpmf.construct_sequences(data, groups, [x for x, _ in patients], item_id="Ontology_cat")
+
+        return [cls(x, y, parameters, find_lpps=False, find_combined_patterns=False, sequence=sequences[i])
+                for i, (x, y) in enumerate(patients)]
+
+    @classmethod
+    def create_batch(cls, patients, parameters: MergeParameters):
+        '''local patterns for each (patient_id, patient_data) pair, with the patterns for all patients mined together'''
+        patient_lpps = cls.create_unmined(patients, parameters)
+        p = parameters
+        episodes = [(x.seq.sequence, x.seq.timestamps) for x in patient_lpps]
+        results = SPD.mine_local_periodic_patterns_batch(episodes, p.max_period, p.min_duration, p.max_spill)
+        for patient_lpp, (all_patterns, all_timestamps) in zip(patient_lpps, results):
+            patient_lpp.all_patterns = all_patterns
+            patient_lpp.all_timestamps = all_timestamps
+            patient_lpp.combine_patterns()
+
+        return patient_lpps
+
+    @classmethod
+    def iterate_parallel(cls, patients, parameters: MergeParameters, n_processes, patients_per_chunk=200, skip_chunks=()):
+        '''Yields (start, local patterns) for chunks of (patient_id, patient_data) pairs as each is mined by a process pool.
+           Chunks are identified by the position of their first patient, and those in skip_chunks are not mined.
+           Workers receive only the day itemsets and timestamps of each patient, and the parameters once per process'''
+        starts = [i for i in range(0, len(patients), patients_per_chunk) if i not in skip_chunks]
+        patient_lpps = cls.create_unmined([x for i in starts for x in patients[i:i + patients_per_chunk]], parameters)
+        chunk_lpps = {}
+        for position, start in enumerate(starts):
+            chunk_lpps[start] = patient_lpps[position * patients_per_chunk:(position + 1) * patients_per_chunk]
+
+        chunks = [(x, [(z.seq.sequence, z.seq.timestamps) for z in y]) for x, y in chunk_lpps.items()]
+        if n_processes and len(chunks) > 1:
+            chunksize = max(1, len(chunks) // (4 * n_processes))
+            with mp.Pool(n_processes, initializer=set_worker_parameters, initargs=(parameters,)) as pool:
+                results = pool.imap_unordered(mine_patient_chunk, chunks, chunksize=chunksize)
+                for start, chunk_results in results:
+                    yield start, cls.set_chunk_results(chunk_lpps[start], chunk_results)
+        else:
+            set_worker_parameters(parameters)
+            for chunk in chunks:
+                start, chunk_results = mine_patient_chunk(chunk)
+                yield start, cls.set_chunk_results(chunk_lpps[start], chunk_results)
+
+    @classmethod
+    def create_parallel(cls, patients, parameters: MergeParameters, n_processes, patients_per_chunk=200):
+        '''local patterns for each (patient_id, patient_data) pair, mined in chunks of patients by a process pool'''
+        chunks = dict(cls.iterate_parallel(patients, parameters, n_processes, patients_per_chunk=patients_per_chunk))
+
+        return [x for start in sorted(chunks) for x in chunks[start]]
+
+    @staticmethod
+    def set_chunk_results(patient_lpps, chunk_results):
+        '''store the mined and combined patterns from mine_patient_chunk'''
+        for patient_lpp, result in zip(patient_lpps, chunk_results):
+            patient_lpp.all_patterns, patient_lpp.all_timestamps, patient_lpp.final_patterns, patient_lpp.final_timestamps = result
+
+        return patient_lpps
+
     def find_lpps(self):
         s = self
         p = self.parameters
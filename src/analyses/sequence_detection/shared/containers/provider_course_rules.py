@@ -2,15 +2,17 @@ import pandas as pd
 from src.core.algorithms.sequence.sequence import SequentialPatternDetection as SPD
 
 class ProviderCourseRules:
-    def __init__(self, provider_id, context, courses, args):
+    def __init__(self, provider_id, context, courses, args, result=None):
         self.n_courses = len(courses)
         self.courses = courses
         self.id = provider_id
         self.context = context
 
-        sequences = [x.item_sequence.sequence for x in courses]
-        filename= f"{provider_id}_{context}"
-        result = SPD.mine_spam(sequences, args, filename)
+        if result is None:
+            sequences = [x.item_sequence.sequence for x in courses]
+            filename= f"{provider_id}_{context}"
+            result = SPD.mine_spam(sequences, args, filename)
+
         result.index = result['pattern'].apply(lambda x: '_'.join(x))
         self.rules = result.index
         self.replaced_rules = {}
@@ -18,6 +20,15 @@ class ProviderCourseRules:
         if args[-1]:
             self.rule_to_course = {x: set(y) for x, y in result['sid'].to_dict().items()}
 
+    @classmethod
+    def create_batch(cls, context, provider_jobs):
+        '''rules for each (provider_id, courses, args) job, with the patterns for all providers mined together'''
+        results = SPD.mine_spam_batch([([x.item_sequence.sequence for x in courses], args)
+                                       for _, courses, args in provider_jobs])
+
+        return [cls(provider_id, context, courses, args, result=result)
+                for (provider_id, courses, args), result in zip(provider_jobs, results)]
+
     def get_proportional_rule_occurrence(self, rule):
         try:
             return self.proportion.loc[rule]
@@ -133,17 +133,22 @@ class SequenceGraph:
 
         return sorted(diffs[0], key=lambda x: x[0])
 
+    @staticmethod
+    def count_day_items(items):
+        day_counts = {}
+        for item in items:
+            day_counts[item] = day_counts.get(item, 0) + 1
+
+        return day_counts
+
     def rule_day_is_subset(self, n, day):
-        sequence_day_counts = {}
-        for item in day.split(' '):
-            sequence_day_counts[item] = sequence_day_counts.get(item, 0) + 1
+        '''day is a space-separated string of items, or item counts from count_day_items'''
+        if isinstance(day, str):
+            day = self.count_day_items(day.split(' '))
 
         rule_day_counts = self.sequence[n]
-        items_to_check = set(sequence_day_counts.keys()).union(set(rule_day_counts.keys()))
-        for item in items_to_check:
-            sequence_count = sequence_day_counts.get(item, 0)
-            rule_count = rule_day_counts.get(item, 0)
-            if rule_count > sequence_count:
+        for item, rule_count in rule_day_counts.items():
+            if rule_count > day.get(item, 0):
                 return False
 
         return True
@@ -0,0 +1,120 @@
+'''Checkpoints of local periodic patterns saved in shards as each chunk of patients is mined'''
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from dataclasses import asdict
+from pathlib import Path
+
+class LppShardStore:
+    '''Local patterns for chunks of patients, saved as one pickle file per chunk with a manifest of finished chunks.
+       Chunks are identified by the position of their first patient. Shards are never removed; a run with other
+       patients, parameters or chunk size than the shards were mined for is refused'''
+    VERSION = 1
+    MANIFEST_FILE = "manifest.json"
+    # runs from before shards saved every local pattern in one pickle in the run folder
+    LEGACY_FILES = ["patient_lpps.pkl", "patient_lpps.pkl.pkl"]
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.manifest = self.read_manifest()
+
+    @staticmethod
+    def create_key(patient_ids, parameters, patients_per_chunk):
+        '''description of a run, to check a store holds shards for the same patients and parameters'''
+        digest = hashlib.sha1('\n'.join(str(x) for x in patient_ids).encode('utf-8')).hexdigest()
+
+        return {"patients": digest,
+                "n_patients": len(patient_ids),
+                "patients_per_chunk": patients_per_chunk,
+                "parameters": asdict(parameters)}
+
+    @staticmethod
+    def get_chunk_starts(n_patients, patients_per_chunk):
+        return list(range(0, n_patients, patients_per_chunk))
+
+    def read_manifest(self):
+        '''the manifest of a previous run, or None if there is no readable manifest of this version'''
+        try:
+            with open(self.directory / self.MANIFEST_FILE, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != self.VERSION:
+            return None
+
+        return manifest
+
+    def write_atomic(self, filename, write):
+        '''write a file elsewhere in the store and move it into place, so a crash never leaves a partial file'''
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                write(f)
+
+            os.replace(tmp_path, self.directory / filename)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def write_manifest(self):
+        self.write_atomic(self.MANIFEST_FILE, lambda f: f.write(json.dumps(self.manifest).encode('utf-8')))
+
+    @classmethod
+    def find_legacy_file(cls, folder):
+        '''the single pickle of local patterns saved in a run folder before shards, or None'''
+        for filename in cls.LEGACY_FILES:
+            path = Path(folder) / filename
+            if path.is_file():
+                return path
+
+        return None
+
+    def prepare(self, key):
+        '''Open the store for a run, checking any finished shards were mined for the same key.
+           Returns the starts of the finished chunks, and raises a ValueError if the shards are for another run'''
+        json_key = json.loads(json.dumps(key))
+        if self.manifest is not None:
+            if self.manifest["key"] != json_key:
+                raise ValueError(f"Local patterns in {self.directory} were mined for other patients or parameters; "
+                                 "set patient_lpp_location to a matching run or leave it unset to mine again")
+
+            return self.get_finished_chunks()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if any(self.directory.glob("shard_*.pkl")):
+            raise ValueError(f"{self.directory} holds shards without a manifest")
+
+        n_chunks = len(self.get_chunk_starts(key["n_patients"], key["patients_per_chunk"]))
+        self.manifest = {"version": self.VERSION, "key": json_key, "n_chunks": n_chunks, "shards": {}}
+        self.write_manifest()
+
+        return set()
+
+    def get_finished_chunks(self):
+        if self.manifest is None:
+            return set()
+
+        return {int(x) for x in self.manifest["shards"]}
+
+    def is_complete(self):
+        '''True if every chunk of the run has a shard'''
+        return self.manifest is not None and len(self.manifest["shards"]) == self.manifest["n_chunks"]
+
+    def write_shard(self, start, patient_lpps):
+        '''save the local patterns for the chunk starting at start, then record the chunk as finished'''
+        filename = f"shard_{start:09d}.pkl"
+        self.write_atomic(filename, lambda f: pickle.dump(patient_lpps, f, pickle.HIGHEST_PROTOCOL))
+        self.manifest["shards"][str(start)] = {"file": filename, "n_patients": len(patient_lpps)}
+        self.write_manifest()
+
+    def read_shard(self, start):
+        with open(self.directory / self.manifest["shards"][str(start)]["file"], 'rb') as f:
+            return pickle.load(f)
+
+    def iterate_shards(self):
+        '''yields the local patterns for each finished chunk, in patient order, one shard at a time'''
+        for start in sorted(self.get_finished_chunks()):
+            yield self.read_shard(start)
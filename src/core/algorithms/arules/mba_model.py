@@ -5,8 +5,10 @@ from tqdm import tqdm
 from src.core.algorithms.arules.mba_comparisons import MbaComparisons
 from src.core.algorithms.arules.pairwise_mba import PairwiseMba
 from src.core.mbs_info.mbs_labeller import ComponentLabeller
+from src.core.algorithms.graphs.graph_utils import GraphUtils
 from src.core.algorithms.graphs.mbs_graphs import MbsGraphColouring
 from src.core.io.file_utils import FileUtils
+from src.core.io.render_queue import RenderEngine, RenderPolicy, RenderQueue
 from src.core.io import config as hc
 
 
@@ -15,8 +17,10 @@ class MbaModel():
     def __init__(self,
                  logger,
                  code_converter,
-                 filters):
+                 filters,
+                 render_policy=None):
         self.code_converter = code_converter
+        self.render_policy = RenderPolicy() if render_policy is None else render_policy
         self.graphs = MbsGraphColouring(logger, code_converter)
         self.logger = logger
         self.log = logger.log
@@ -48,7 +52,7 @@ class MbaModel():
         return d, counts
 
     def create_graph(self, d, name, title, attrs=None, graph_style='fdp', file_extension='png'):
-        '''Create a visual graph from a graph dictionary'''
+        '''Create a visual graph from a graph dictionary with the engines chosen by the render policy'''
         filename = self.logger.output_path / f"{name}.{file_extension}"
         filters = self.pairwise.filters
         if filters['conviction']['value'] == 0 \
@@ -60,15 +64,35 @@ class MbaModel():
             directed = True
 
         self.log(f"Graphing {title}")
-        try:
-            self.graphs.visual_graph(d, filename, title=title, directed=directed, node_attrs=attrs, graph_style=graph_style)
-        except:
-            pass
-
-        try:
-            self.graphs.create_visnetwork(d, filename, title, attrs)
-        except:
-            pass
+        # plain GraphUtils avoids sending the code converter to the render processes
+        renderer = GraphUtils(self.logger)
+        render_queue = getattr(self.logger, "render_queue", None)
+        render_now = render_queue is None
+        if render_now:
+            render_queue = RenderQueue(self.logger, 0)
+
+        n_nodes = len(self.graphs.flatten_graph_dict(d))
+        engines = self.render_policy.select_engines(n_nodes)
+        if engines != self.render_policy.engines:
+            self.log(f"Skipping layout for graph with {n_nodes} nodes")
+
+        budget = self.render_policy.time_budget
+        if RenderEngine.GRAPHVIZ in engines:
+            render_queue.submit(f"{filename} graphviz", renderer.visual_graph,
+                                d, filename, title=title, directed=directed, node_attrs=attrs,
+                                graph_style=graph_style, timeout=budget, time_budget=budget)
+
+        if RenderEngine.VISNETWORK in engines:
+            render_queue.submit(f"{filename} visnetwork", renderer.create_visnetwork,
+                                d, filename, title, attrs, time_budget=budget)
+
+        if RenderEngine.DOT in engines:
+            dot_file = filename.with_suffix(".dot")
+            render_queue.submit(f"{dot_file} DOT", renderer.write_dot,
+                                d, dot_file, title=title, directed=directed, node_attrs=attrs)
+
+        if render_now:
+            render_queue.join()
 
     def create_reference_model(self, min_support, name, documents, all_unique_items, node_labels, colour=True, graph_type=True, header=hc.ITEM):
         '''Commands related to creation, graphing and saving of the state models'''
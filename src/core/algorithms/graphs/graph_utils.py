@@ -1,7 +1,11 @@
 '''functions for quick graphing'''
 import os
 import random
+import subprocess
+from collections import Counter
 from copy import deepcopy
+from functools import lru_cache
+from pathlib import Path
 import pandas as pd
 try:
     import pygraphviz as pgv
@@ -9,11 +13,24 @@ try:
 except ImportError:
     pass
 
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 from tqdm import tqdm
 
-pandas2ri.activate()
+@lru_cache(maxsize=None)
+def get_r_converter():
+    '''import rpy2 and start the embedded R interpreter on first use, returning the pandas converter'''
+    from rpy2.robjects import pandas2ri # pylint: disable=import-outside-toplevel
+
+    pandas2ri.activate()
+
+    return pandas2ri
+
+@lru_cache(maxsize=None)
+def importr(package):
+    '''import an R package, starting R if it is not already running'''
+    get_r_converter()
+    from rpy2.robjects.packages import importr as rpy2_importr # pylint: disable=import-outside-toplevel
+
+    return rpy2_importr(package)
 
 class GraphUtils():
     '''Functions for visualising, saving, and manipulating plots and graphs'''
@@ -85,25 +102,24 @@ class GraphUtils():
     def collapse_same_connection_bipartite_nodes(cls, graph):
         '''For a bipartite graph with one set of nodes as keys and one set as values,
            collapse the keys which share the same connections'''
-        temp = {k: set(v) for k, v in cls.convert_pgv_to_simple(graph).items()}
+        temp = cls.convert_pgv_to_simple(graph)
         new_graph = {}
         attrs = {}
         node_info = {}
-        n_keys = 0
+        connection_groups = {} # keyed by the frozen set of connections, so each lookup is constant time
         for k, v in temp.items():
-            found = False
-            for name, test in new_graph.items():
-                if not test.symmetric_difference(v):
-                    node_info[name]["count"] += 1
-                    node_info[name]["providers"].append(k)
-                    found = True
-                    break
+            connections = frozenset(v)
+            name = connection_groups.get(connections, None)
+            if name is not None:
+                node_info[name]["count"] += 1
+                node_info[name]["providers"].append(k)
+                continue
 
-            if not found:
-                new_graph[f"gr_{n_keys}"] = v
-                attrs[f"gr_{n_keys}"] = {"type": "provider", "shape": "triangle"} # Not generalised here
-                node_info[f"gr_{n_keys}"] = {"count": 1, "providers": [k]}
-                n_keys += 1
+            name = f"gr_{len(connection_groups)}"
+            connection_groups[connections] = name
+            new_graph[name] = v
+            attrs[name] = {"type": "provider", "shape": "triangle"} # Not generalised here
+            node_info[name] = {"count": 1, "providers": [k]}
 
         return cls.convert_simple_to_pgv(new_graph), attrs, node_info
 
@@ -131,7 +147,7 @@ class GraphUtils():
     @classmethod
     def convert_graph_to_adjacency_matrix(cls, graph):
         '''convert a graph dictionary to an adjacency matrix in pandas format'''
-        items = cls.flatten_graph_dict(graph)
+        items = list(cls.flatten_graph_dict(graph))
         a_m = pd.DataFrame(0, index=items, columns=items)
         for ante in graph.keys():
             for con in graph[ante].keys():
@@ -160,7 +176,7 @@ class GraphUtils():
     @classmethod
     def create_feature_matrix_from_graph(cls, graph):
         '''create a graph feature matrix in pandas format from a graph dictionary'''
-        idx = cls.flatten_graph_dict(graph)
+        idx = list(cls.flatten_graph_dict(graph))
         mat = pd.DataFrame(0, index=idx, columns=idx)
         for item in idx:
             mat.at[item, item] = 1
@@ -185,7 +201,7 @@ class GraphUtils():
         aplot = importr('graphics')
         circlize = importr('circlize')
         rDevices = importr('grDevices')
-        r_am = pandas2ri.conversion.py2rpy(edges)
+        r_am = get_r_converter().conversion.py2rpy(edges)
         filename = self.logger.output_path / f'{name}.png'
         rDevices.png(str(filename), width=800, height=800) # pylint: disable=no-member
         circlize.chordDiagram(r_am, # pylint: disable=no-member
@@ -205,7 +221,7 @@ class GraphUtils():
             nodes['label'] = nodes.index
             nodes['groupname'] = nodes['color']
         else:
-            nodes = pd.DataFrame(self.flatten_graph_dict(graph), columns=['id'])
+            nodes = pd.DataFrame(list(self.flatten_graph_dict(graph)), columns=['id'])
             nodes['label'] = nodes['id']
 
         from_nodes = []
@@ -223,6 +239,7 @@ class GraphUtils():
         edges.columns = ['from', 'to', 'color']
 
         vn = importr('visNetwork')
+        pandas2ri = get_r_converter()
         r_nodes = pandas2ri.conversion.py2rpy(nodes)
         r_edges = pandas2ri.conversion.py2rpy(edges)
 
@@ -409,19 +426,24 @@ class GraphUtils():
         return score, edit_history, edit_attrs
 
     @classmethod
-    def identify_closest_component(cls, components, d):
-        '''Identify component a model is closest to'''
-        test_items = cls.flatten_graph_dict(d)
-        component_score = []
-        for component in components:
-            joint_items = test_items.intersection(component)
-            component_score.append(len(joint_items))
-
-        max_score = max(component_score)
-        if max_score == 0:
+    def create_component_index(cls, components):
+        '''Map each item to the id of the component containing it
+           components are expected to be disjoint, as returned by find_graph_components'''
+        return {item: idx for idx, component in enumerate(components) for item in component}
+
+    @classmethod
+    def identify_closest_component(cls, components, d, component_index=None):
+        '''Identify component a model is closest to
+           pass a component index from create_component_index to avoid rebuilding it for each model'''
+        if component_index is None:
+            component_index = cls.create_component_index(components)
+
+        component_score = Counter(component_index[x] for x in cls.flatten_graph_dict(d) if x in component_index)
+        if not component_score:
             return len(components)
 
-        return component_score.index(max_score)
+        # ties go to the lowest component id
+        return min(component_score, key=lambda idx: (-component_score[idx], idx))
 
     @classmethod
     def stringify_graph(cls, graph):
@@ -435,14 +457,8 @@ class GraphUtils():
         return str_graph
 
     @classmethod
-    def visual_graph(cls,
-                     data_dict,
-                     output_file,
-                     title=None,
-                     directed=True,
-                     node_attrs=None,
-                     graph_style='fdp'):
-        '''Create a pygraphviz graph from a graph dictionary'''
+    def create_pgv_graph(cls, data_dict, title=None, directed=True, node_attrs=None):
+        '''Create a styled pygraphviz graph from a graph dictionary without running a layout'''
         max_len = 0
         full_list = cls.flatten_graph_dict(data_dict)
         for s in full_list:
@@ -487,8 +503,37 @@ class GraphUtils():
                 for attr, val in v.items():
                     node.attr[attr] = val
 
+        return graph
+
+    @classmethod
+    def visual_graph(cls,
+                     data_dict,
+                     output_file,
+                     title=None,
+                     directed=True,
+                     node_attrs=None,
+                     graph_style='fdp',
+                     timeout=None):
+        '''Create a pygraphviz graph from a graph dictionary
+           if a timeout in seconds is given the layout program is killed when it runs over'''
+        graph = cls.create_pgv_graph(data_dict, title=title, directed=directed, node_attrs=node_attrs)
+        if timeout is None:
+            graph.draw(str(output_file), prog=graph_style)
+
+            return
+
+        file_format = Path(output_file).suffix[1:]
+        subprocess.run([graph_style, f"-T{file_format}", f"-o{output_file}"],
+                       input=graph.string().encode('utf-8'),
+                       capture_output=True,
+                       check=True,
+                       timeout=timeout)
 
-        graph.draw(str(output_file), prog=graph_style)
+    @classmethod
+    def write_dot(cls, data_dict, output_file, title=None, directed=True, node_attrs=None):
+        '''Save a graph dictionary as DOT text for later layout'''
+        graph = cls.create_pgv_graph(data_dict, title=title, directed=directed, node_attrs=node_attrs)
+        graph.write(str(output_file))
 
     @classmethod
     def graph_legend(cls, data_dict, output_file, title=None):
@@ -0,0 +1,24 @@
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Paths;
+import java.util.Arrays;
+import ca.pfv.spmf.gui.CommandProcessor;
+
+/**
+ * Runs every SPMF job in a tab-separated job file in one JVM.
+ * Each line holds the algorithm name, input file, output file, then the algorithm parameters.
+ * Run with the single-file source launcher of a JDK: java -cp spmf.jar SpmfBatch.java jobs.tsv
+ */
+public class SpmfBatch {
+    public static void main(String[] args) throws Exception {
+        for (String line : Files.readAllLines(Paths.get(args[0]), StandardCharsets.UTF_8)) {
+            if (line.isEmpty()) {
+                continue;
+            }
+
+            String[] fields = line.split("\t", -1);
+            String[] parameters = Arrays.copyOfRange(fields, 3, fields.length);
+            CommandProcessor.runAlgorithm(fields[0], fields[1], fields[2], parameters);
+        }
+    }
+}
@@ -1,21 +1,43 @@
 '''create date map from pandas date series'''
-from datetime import timedelta
+import numpy as np
 import pandas as pd
 
-class DateMap:
+class DateOffsets:
+    '''converts dates to day offsets from an origin date and back, with the origin as day 1'''
+    def __init__(self, origin):
+        self.origin = np.datetime64(pd.Timestamp(origin), 'D')
+
+    @classmethod
+    def from_dates(cls, dates):
+        '''offsets from the earliest of the dates'''
+        return cls(np.asarray(pd.to_datetime(dates)).min())
+
+    def get_timestamps_from_dates(self, dates):
+        '''int32 day offsets for an array or series of dates'''
+        days = np.asarray(pd.to_datetime(dates)).astype("datetime64[D]")
+
+        return ((days - self.origin).astype(np.int64) + 1).astype(np.int32)
+
+    def get_dates_from_timestamps(self, timestamps):
+        '''datetime64 dates for an array of day offsets'''
+        offsets = np.asarray(timestamps, dtype=np.int64) - 1
+
+        return (self.origin + offsets.astype("timedelta64[D]")).astype("datetime64[ns]")
+
+class DateMap(DateOffsets):
+    '''day offsets for the dates of a patient, from their first date'''
     def __init__(self, dates):
-        sorted_unique = pd.Series(dates.unique()).sort_values()
-        start = sorted_unique.min()
-        date_map = {}
-        for date in sorted_unique:
-            days = date - start
-            date_map[date] = (days + timedelta(days=1)).days
+        super().__init__(np.asarray(pd.to_datetime(dates)).min())
+
+    def __setstate__(self, state):
+        if "origin" not in state:
+            # date maps pickled before offsets were calculated held a dictionary of dates
+            state = {"origin": np.datetime64(min(state["map"]), 'D')}
 
-        self.map = date_map
-        self.reversed_map = {v: k for k, v in date_map.items()}
+        self.__dict__.update(state)
 
     def get_date_from_timestamp(self, timestamp):
-        return self.reversed_map[timestamp]
+        return pd.Timestamp(self.origin + np.timedelta64(int(timestamp) - 1, 'D'))
 
     def get_timestamp_from_date(self, date):
-        return self.map[date]
\ No newline at end of file
+        return int((np.datetime64(pd.Timestamp(date), 'D') - self.origin).astype(np.int64)) + 1
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from datetime import timedelta
+import numpy as np
 import pandas as pd
 from src.core.algorithms.sequence.date_map import DateMap
 import src.core.io.config as hc
@@ -10,6 +11,45 @@ class SequenceInformation:
     timestamps: list
     costs: list
     identifier: str
+    item_codes: np.ndarray = None
+    day_offsets: np.ndarray = None
+    items: np.ndarray = None
+
+    def get_day_items(self):
+        '''the items claimed on each day, from the item codes where available'''
+        if self.item_codes is None:
+            return [tuple(day.split(' ')) for day in self.sequence]
+
+        names = self.items[self.item_codes]
+
+        return [tuple(names[self.day_offsets[i]:self.day_offsets[i + 1]]) for i in range(len(self.day_offsets) - 1)]
+
+@dataclass
+class SequenceColumns:
+    '''sequences for many patients or courses as flat arrays of days,
+       with the days of sequence i in positions offsets[i] to offsets[i + 1]'''
+    sequence: np.ndarray
+    timestamps: np.ndarray
+    costs: np.ndarray
+    offsets: np.ndarray
+    identifiers: list
+    item_codes: np.ndarray = None
+    day_offsets: np.ndarray = None
+    items: np.ndarray = None
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __getitem__(self, i):
+        '''sequence information for one sequence, as views of the flat arrays'''
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        days = slice(start, end)
+        codes = slice(self.day_offsets[start], self.day_offsets[end])
+
+        return SequenceInformation(self.sequence[days], self.timestamps[days], self.costs[days], self.identifiers[i],
+                                   self.item_codes[codes], self.day_offsets[start:end + 1] - self.day_offsets[start],
+                                   self.items)
 
 class FormatSpmf:
     @classmethod
@@ -26,53 +66,125 @@ class FormatSpmf:
                            item_id=hc.ITEM,
                            timestamp_id=hc.DATE,
                            cost_id=hc.COST,
-                           date_map=None,
-                           uniques_only_in_itemset=False):
-        '''convert a dataframe for a single event into sequence data'''
-        ret = SequenceInformation([], [], [], identifier)
-        if date_map is None:
-            date_map = cls.create_date_map(info[timestamp_id])
-
-        days = info.groupby(timestamp_id)
-        for day, group in days:
-            items = group[item_id].unique().tolist()
-            if uniques_only_in_itemset:
-                itemset = set(items)
-            else:
-                itemset = items
-
-            element = ' '.join(tuple(sorted(itemset)))
-            ret.sequence.append(element)
-            day_costs = int(group[cost_id].sum())
-            ret.costs.append(day_costs)
-            ret.timestamps.append(date_map.get_timestamp_from_date(day))
-
-        return ret
+                           date_map=None):
+        '''convert a dataframe for a single event into sequence data.
+           Each day is always the sorted unique items claimed that day'''
+        origins = None
+        if date_map is not None:
+            origins = np.array([date_map.origin], dtype="datetime64[D]")
+
+        groups = np.zeros(len(info), dtype=np.int64)
+        sequences = cls.construct_sequences(info, groups, [identifier], item_id=item_id, timestamp_id=timestamp_id,
+                                            cost_id=cost_id, origins=origins)
+
+        return sequences[0]
 
     @classmethod
-    def convert_to_spmf_standard(cls, sequences):
-        all_items = sorted(set([x for seq in sequences for day in seq for x in day.split(' ')]))
-        cat_map = {v: str(k) for k, v in enumerate(all_items)}
-        output = "@CONVERTED_FROM_TEXT\n"
-        for code, n in cat_map.items():
-            output += f"@ITEM={n}={code}\n"
+    def construct_sequences(cls,
+                            info,
+                            groups,
+                            identifiers,
+                            item_id=hc.ITEM,
+                            timestamp_id=hc.DATE,
+                            cost_id=hc.COST,
+                            origins=None):
+        '''Convert claims for many patients or courses into sequence data in one pass.
+           groups gives the position in identifiers of the sequence each row belongs to.
+           Each day is the sorted unique items claimed that day, and timestamps count days from the origin of the
+           sequence, which is its first day unless origins are given'''
+        n_groups = len(identifiers)
+        groups = np.asarray(groups, dtype=np.int64)
+        days = pd.to_datetime(np.asarray(info[timestamp_id])).values.astype("datetime64[D]").astype(np.int64)
+        items = np.asarray(info[item_id])
+        costs = np.asarray(info[cost_id])
+        order = np.lexsort((days, groups))
+        groups = groups[order]
+        days = days[order]
+        items = items[order]
+        costs = costs[order]
+
+        new_day = np.ones(len(order), dtype=bool)
+        new_day[1:] = (groups[1:] != groups[:-1]) | (days[1:] != days[:-1])
+        day_starts = np.flatnonzero(new_day)
+        day_index = np.cumsum(new_day) - 1
+
+        item_codes, item_names = cls.encode_items(items)
+        day_items = np.unique(day_index * max(len(item_names), 1) + item_codes)
+        item_days = day_items // max(len(item_names), 1)
+        item_codes = (day_items % max(len(item_names), 1)).astype(np.int32)
+        day_offsets = np.zeros(len(day_starts) + 1, dtype=np.int64)
+        day_offsets[1:] = np.cumsum(np.bincount(item_days, minlength=len(day_starts)))
+        sequence = cls.decode_days(item_codes, day_offsets, item_names)
+
+        day_costs = np.add.reduceat(costs, day_starts) if len(order) else costs
+        day_costs = np.trunc(np.asarray(day_costs, dtype=np.float64)).astype(np.int64)
+        day_groups = groups[day_starts]
+        day_values = days[day_starts]
+        offsets = np.zeros(n_groups + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(day_groups, minlength=n_groups))
+        if origins is None:
+            origin_days = np.zeros(n_groups, dtype=np.int64)
+            has_days = offsets[1:] > offsets[:-1]
+            origin_days[has_days] = day_values[offsets[:-1][has_days]]
+        else:
+            origin_days = np.asarray(origins, dtype="datetime64[D]").astype(np.int64)
+
+        timestamps = day_values - origin_days[day_groups] + 1
+
+        return SequenceColumns(sequence, timestamps, day_costs, offsets, list(identifiers),
+                               item_codes, day_offsets, item_names)
+
+    @staticmethod
+    def encode_items(items):
+        '''integer codes for items, numbered in sorted order of the item names'''
+        codes, names = pd.factorize(np.asarray(items, dtype=object), sort=True)
+
+        return codes.astype(np.int64), np.asarray(names, dtype=object)
+
+    @staticmethod
+    def get_separators(n_tokens, boundaries, inner, outer):
+        '''the separator following each token: outer after the last token before each boundary, otherwise inner'''
+        separators = np.full(n_tokens, inner, dtype=object)
+        ends = np.asarray(boundaries[1:], dtype=np.int64) - 1
+        separators[ends[ends >= 0]] = outer
+
+        return separators
 
-        lines = []
-        for seq in sequences:
-            line = []
-            for day in seq:
-                par_line = []
-                items = day.split(' ')
-                for item in items:
-                    cat = cat_map[item]
-                    par_line.append(cat)
+    @classmethod
+    def decode_days(cls, item_codes, day_offsets, item_names):
+        '''space-separated item names for each day, built with a single join'''
+        separators = cls.get_separators(len(item_codes), day_offsets, ' ', '\n')
+        text = ''.join(item_names[item_codes] + separators)
 
-                line.append(' '.join(par_line))
+        return np.array(text.split('\n')[:-1], dtype=object)
 
-            line = ' -1 '.join(line)
-            lines.append(line)
+    @classmethod
+    def convert_to_spmf_standard(cls, sequences):
+        '''SPMF text for sequences of space-separated itemsets'''
+        days = [day for seq in sequences for day in seq]
+        tokens = ' '.join(days).split(' ') if days else []
+        item_codes, item_names = cls.encode_items(tokens)
+        day_lengths = [day.count(' ') + 1 for day in days]
+        day_offsets = np.zeros(len(days) + 1, dtype=np.int64)
+        day_offsets[1:] = np.cumsum(day_lengths)
+        sequence_offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        sequence_offsets[1:] = np.cumsum([len(seq) for seq in sequences])
+
+        return cls.convert_codes_to_spmf_standard(item_codes, day_offsets, sequence_offsets, item_names)
 
-        return output + ' -1 -2\n'.join(lines) + ' -1 -2\n'
+    @classmethod
+    def convert_codes_to_spmf_standard(cls, item_codes, day_offsets, sequence_offsets, item_names):
+        '''SPMF text for integer-coded sequences, where item_names[i] is the name of item i,
+           day_offsets bound the items of each day and sequence_offsets bound the days of each sequence'''
+        output = "@CONVERTED_FROM_TEXT\n"
+        output += ''.join(f"@ITEM={i}={name}\n" for i, name in enumerate(item_names))
+        separators = cls.get_separators(len(item_codes), day_offsets, ' ', ' -1 ')
+        sequence_offsets = np.asarray(sequence_offsets, dtype=np.int64)
+        last_days = sequence_offsets[1:][sequence_offsets[1:] > sequence_offsets[:-1]]
+        separators[np.asarray(day_offsets, dtype=np.int64)[last_days] - 1] = ' -1 -2\n'
+        codes = np.arange(len(item_names)).astype(str).astype(object)
+
+        return output + ''.join(codes[item_codes] + separators)
 
     @classmethod
     def convert_to_spmf_episode(cls, sequence, dates):
@@ -1,4 +1,4 @@
-from copy import deepcopy
+from bisect import bisect_right
 from dataclasses import dataclass
 
 @dataclass
@@ -13,53 +13,30 @@ class Merger:
     '''functions for merging parts of a multi-part sequence (i.e., initiator or terminator with timestamps from other patterns)'''
     @classmethod
     def merge_initiator(cls, initiator_dates, timestamps, max_interval, drop_no_initiator=True):
-        '''Find relevant timestamps and merge them'''
-        timestamps = deepcopy(timestamps)
-        has_init = set()
+        '''Find relevant timestamps and merge them.
+           Timestamps are sorted, non-overlapping (start, end) tuples, as from combining overlapping patterns.
+           An initiator is during a timestamp it falls within, and prior to timestamps starting up to max_interval after it;
+           if it is related to more than one timestamp they are merged into one timestamp which includes the initiator'''
+        starts = [x[0] for x in timestamps]
+        ends = [x[1] for x in timestamps]
+        has_init = [False] * len(timestamps)
         for init_date in sorted(initiator_dates):
-            prior = []
-            during = []
-            no_subsequent = 0
-            many_subsequent = 0
-            for j, tup in enumerate(timestamps):
-                difference_beginning = tup[0] - init_date
-                difference_end = tup[1] - init_date
-                if difference_beginning > 0 and difference_beginning <= max_interval:
-                    prior.append(j)
-                elif difference_end >= 0 and difference_beginning <=0:
-                    during.append(j)
+            first_prior = bisect_right(starts, init_date)
+            end_prior = bisect_right(starts, init_date + max_interval)
+            first = first_prior
+            if first_prior > 0 and ends[first_prior - 1] >= init_date:
+                first -= 1 # the initiator is during this timestamp
 
-            has_init.update(prior)
-            has_init.update(during)
-            if not prior and not during:
-                # self.log(f"{ep_id} had initiator with no following sequence")
-                no_subsequent += 1
-                # timestamps.append(tuple([init_date, init_date]))
-            elif sum([len(prior), len(during)]) > 1:
-                # self.log(f"{ep_id} had multiple valid sequences following an initiator")
-                many_subsequent += 1
-                idxs = set(prior + during)
-                mins = min([init_date] + [timestamps[j][0] for j in idxs])
-                maxs = max([init_date] + [timestamps[j][1] for j in idxs])
-                for j in sorted(idxs, reverse=True):
-                    del timestamps[j]
-                    has_init.remove(j)
+            if end_prior - first > 1:
+                merged_start = min(init_date, starts[first])
+                merged_end = max([init_date] + ends[first:end_prior])
+                starts[first:end_prior] = [merged_start]
+                ends[first:end_prior] = [merged_end]
+                has_init[first:end_prior] = [True]
+            elif end_prior - first == 1:
+                if first == first_prior:
+                    starts[first] = init_date
 
-                new_timestamp = tuple([mins, maxs])
-                timestamps.append(new_timestamp)
-                timestamps.sort()
-                has_init.add(timestamps.index(new_timestamp))
-            elif prior:
-                timestamps[prior[0]] = tuple([init_date, timestamps[prior[0]][1]])
-            elif during:
-                pass
-            else:
-                raise RuntimeError("This should never happen")
+                has_init[first] = True
 
-        # combine initiators with LPPs
-        if drop_no_initiator:
-            remove =  set(range(len(timestamps))) - has_init
-            for j in sorted(remove, reverse=True):
-                del timestamps[j]
-
-        return timestamps
+        return [(start, end) for start, end, init in zip(starts, ends, has_init) if init or not drop_no_initiator]
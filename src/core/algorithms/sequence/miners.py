@@ -0,0 +1,253 @@
+'''In-process implementations of the SPMF pattern mining algorithms used for sequence detection'''
+import math
+from enum import Enum
+import numpy as np
+
+class MiningBackend(Enum):
+    '''implementations available for pattern mining'''
+    PYTHON = 0
+    SPMF = 1
+
+class CmSpam:
+    '''CM-SPAM sequential pattern mining with the options and results of the SPMF implementation.
+       Each item is held as one bitset per sequence, with bit i set if the item is in itemset i of the sequence.
+       Sequence extensions are pruned with a co-occurrence map of item pairs frequent in order'''
+    def __init__(self, min_support, min_length=1, max_length=None, required_items=None, max_gap=None):
+        self.min_support = min_support
+        self.min_length = min_length
+        self.max_length = max_length
+        self.required_items = set(required_items) if required_items else set()
+        self.max_gap = max_gap
+
+    @classmethod
+    def from_spmf_arguments(cls, args):
+        '''create a miner from the SPMF CM-SPAM arguments:
+           minimum support, minimum length, maximum length, required items, maximum gap, show sequence ids'''
+        defaults = [None, 1, None, "", None, False]
+        args = list(args) + defaults[len(args):]
+        required = [x for x in str(args[3]).replace(' ', ',').split(',') if x]
+        miner = cls(args[0], min_length=int(args[1]), max_length=args[2], required_items=required, max_gap=args[4])
+
+        return miner, bool(args[5])
+
+    @staticmethod
+    def get_absolute_support(min_support, n_sequences):
+        '''minimum number of sequences for a pattern, from a proportion or a percentage string such as "5%"'''
+        if isinstance(min_support, str):
+            min_support = float(min_support.strip().rstrip('%')) / 100 if '%' in min_support else float(min_support)
+
+        return max(1, math.ceil(min_support * n_sequences))
+
+    @staticmethod
+    def get_itemsets(sequences):
+        '''split space-separated itemsets into sorted tuples of items'''
+        return [[tuple(sorted(set(day.split(' ')))) for day in seq] for seq in sequences]
+
+    @staticmethod
+    def create_vertical_database(itemsets):
+        '''bitsets for every item, as a dictionary of sequence index to bitset'''
+        bitsets = {}
+        for sid, seq in enumerate(itemsets):
+            for position, itemset in enumerate(seq):
+                for item in itemset:
+                    item_bitsets = bitsets.setdefault(item, {})
+                    item_bitsets[sid] = item_bitsets.get(sid, 0) | (1 << position)
+
+        return bitsets
+
+    @staticmethod
+    def create_sequence_cmap(bitsets, items, n_sequences, min_support):
+        '''co-occurrence map of item pairs (a, b) where b follows a in at least min_support sequences'''
+        first = np.full((len(items), n_sequences), np.iinfo(np.int64).max, dtype=np.int64)
+        last = np.full((len(items), n_sequences), -1, dtype=np.int64)
+        for i, item in enumerate(items):
+            for sid, bits in bitsets[item].items():
+                first[i, sid] = (bits & -bits).bit_length() - 1
+                last[i, sid] = bits.bit_length() - 1
+
+        cmap = {}
+        for i, item in enumerate(items):
+            counts = (first[i] < last).sum(axis=1)
+            cmap[item] = {items[j] for j in np.flatnonzero(counts >= min_support)}
+
+        return cmap
+
+    @staticmethod
+    def sequence_extension(prefix, item_bitsets, max_gap=None):
+        '''bitsets of the positions item can follow the prefix, within the maximum gap'''
+        extension = {}
+        for sid, prefix_bits in prefix.items():
+            bits = item_bitsets.get(sid)
+            if bits is None:
+                continue
+
+            if max_gap is None:
+                first = prefix_bits & -prefix_bits
+                following = ~((first << 1) - 1)
+            else:
+                following = 0
+                for k in range(1, max_gap + 1):
+                    following |= prefix_bits << k
+
+            bits &= following
+            if bits:
+                extension[sid] = bits
+
+        return extension
+
+    @staticmethod
+    def itemset_extension(prefix, item_bitsets):
+        '''bitsets of the positions item is in the last itemset of the prefix'''
+        extension = {}
+        for sid, prefix_bits in prefix.items():
+            bits = prefix_bits & item_bitsets.get(sid, 0)
+            if bits:
+                extension[sid] = bits
+
+        return extension
+
+    def mine(self, sequences):
+        '''Find frequent sequential patterns in a list of sequences of space-separated itemsets.
+           Returns a list of (pattern, support, sequence indices), with each pattern a tuple of sorted itemsets'''
+        itemsets = self.get_itemsets(sequences)
+        min_support = self.get_absolute_support(self.min_support, len(itemsets))
+        max_gap = None if self.max_gap in (None, "") else int(self.max_gap)
+        if max_gap is not None and max_gap >= max((len(x) for x in itemsets), default=0):
+            max_gap = None
+
+        max_length = math.inf if self.max_length in (None, "") else int(self.max_length)
+        bitsets = self.create_vertical_database(itemsets)
+        items = sorted(x for x, y in bitsets.items() if len(y) >= min_support)
+        cmap = self.create_sequence_cmap(bitsets, items, len(itemsets), min_support) if items else {}
+        patterns = []
+
+        def save(pattern, prefix, length):
+            if length < self.min_length:
+                return
+
+            if self.required_items and not self.required_items.issubset(x for y in pattern for x in y):
+                return
+
+            patterns.append((pattern, len(prefix), sorted(prefix)))
+
+        def search(pattern, prefix, s_items, i_items, last_item, length):
+            if length >= max_length:
+                return
+
+            # with a gap constraint a pattern which is infrequent after one prefix may still follow a longer prefix
+            candidates = items if max_gap is not None else s_items
+            s_extensions = []
+            for item in candidates:
+                if item not in cmap[last_item]:
+                    continue
+
+                extension = self.sequence_extension(prefix, bitsets[item], max_gap)
+                if len(extension) >= min_support:
+                    s_extensions.append((item, extension))
+
+            s_frequent = [x[0] for x in s_extensions]
+            for item, extension in s_extensions:
+                new_pattern = pattern + ((item,),)
+                save(new_pattern, extension, length + 1)
+                search(new_pattern, extension, s_frequent, [x for x in s_frequent if x > item], item, length + 1)
+
+            i_extensions = []
+            for item in i_items:
+                extension = self.itemset_extension(prefix, bitsets[item])
+                if len(extension) >= min_support:
+                    i_extensions.append((item, extension))
+
+            i_frequent = [x[0] for x in i_extensions]
+            for item, extension in i_extensions:
+                new_pattern = pattern[:-1] + (pattern[-1] + (item,),)
+                save(new_pattern, extension, length + 1)
+                search(new_pattern, extension, s_frequent, [x for x in i_frequent if x > item], item, length + 1)
+
+        for item in items:
+            pattern = ((item,),)
+            prefix = bitsets[item]
+            save(pattern, prefix, 1)
+            search(pattern, prefix, items, [x for x in items if x > item], item, 1)
+
+        return patterns
+
+class LppGrowth:
+    '''Local periodic pattern mining, giving the patterns and time intervals found by the SPMF LPPGrowth implementation.
+       An interval opens at the first of two timestamps of an itemset no more than the maximum period apart, with the
+       spillover starting at the maximum spillover. It closes at the last timestamp before the spillover of the periods
+       beyond the maximum period exceeds the maximum spillover, and is kept if it lasts at least the minimum duration.
+       An interval still open after the last timestamp of the itemset runs to the end of the sequence if the period
+       to the end does not close it'''
+    def __init__(self, max_period, min_duration, max_spillover):
+        self.max_period = max_period
+        self.min_duration = min_duration
+        self.max_spillover = max_spillover
+
+    def get_intervals(self, timestamps, end):
+        '''local periodic time intervals for a sorted array of timestamps in a sequence ending at end'''
+        intervals = []
+        values = timestamps.tolist()
+        start = None
+        spillover = 0
+        for previous, timestamp in zip(values, values[1:]):
+            period = timestamp - previous
+            if start is None:
+                if period > self.max_period:
+                    continue
+
+                start = previous
+                spillover = self.max_spillover
+
+            spillover = max(0, spillover + period - self.max_period)
+            if spillover > self.max_spillover:
+                if previous - start >= self.min_duration:
+                    intervals.append((start, previous))
+
+                start = None
+
+        if start is not None:
+            spillover = max(0, spillover + end - values[-1] - self.max_period)
+            if spillover <= self.max_spillover:
+                if end - start >= self.min_duration:
+                    intervals.append((start, end))
+            elif values[-1] - start >= self.min_duration:
+                intervals.append((start, values[-1]))
+
+        return intervals
+
+    def mine(self, sequence, timestamps):
+        '''Find local periodic itemsets in a sequence of space-separated itemsets with a timestamp for each.
+           The sequence ends at its last timestamp. Returns a list of (itemset, intervals)'''
+        if len(sequence) == 0:
+            return []
+
+        end = timestamps[-1]
+        occurrences = {}
+        for itemset, timestamp in zip(sequence, timestamps):
+            for item in set(itemset.split(' ')):
+                occurrences.setdefault(item, []).append(timestamp)
+
+        item_timestamps = {x: np.unique(np.asarray(y, dtype=np.int64)) for x, y in occurrences.items()}
+        patterns = []
+        # the timestamps of a superset are a subset of those of the itemset,
+        # so itemsets without a local periodic interval are not extended
+        frequent = []
+        for item in sorted(item_timestamps):
+            intervals = self.get_intervals(item_timestamps[item], end)
+            if intervals:
+                frequent.append(item)
+                patterns.append(((item,), intervals))
+
+        def search(itemset, itemset_timestamps, candidates):
+            for i, item in enumerate(candidates):
+                combined = np.intersect1d(itemset_timestamps, item_timestamps[item], assume_unique=True)
+                intervals = self.get_intervals(combined, end)
+                if intervals:
+                    new_itemset = itemset + (item,)
+                    patterns.append((new_itemset, intervals))
+                    search(new_itemset, combined, candidates[i + 1:])
+
+        for i, item in enumerate(frequent):
+            search((item,), item_timestamps[item], frequent[i + 1:])
+
+        return patterns
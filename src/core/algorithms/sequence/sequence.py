@@ -1,13 +1,20 @@
 '''Custom algorithms for detecting sequential patterns'''
 import os
-from datetime import datetime
+import tempfile
 from itertools import combinations
-from random import randint
+import numpy as np
+import pandas as pd
 from spmf import Spmf
 from src.core.algorithms.sequence.format import FormatSpmf
+from src.core.algorithms.sequence.miners import CmSpam, LppGrowth, MiningBackend
+from src.core.algorithms.sequence.spmf_batch import SpmfBatch
 
 class SequentialPatternDetection:
     '''Container for sequential pattern detection algorithms'''
+    backend = MiningBackend.PYTHON
+    scratch_root = None
+    MAX_ENUMERATED_PATTERN_ITEMS = 12
+
     @classmethod
     def check_overlap(cls, x0, x1, y0, y1, tol=0):
         if max(x0, y0) > (min(x1, y1) + tol):
@@ -16,98 +23,218 @@ class SequentialPatternDetection:
             return True
 
     @classmethod
-    def generate_file_name(cls):
-        rand = randint(100000,999999)
-        temp_file = f"spmf_output_{datetime.now().isoformat()}_{rand}"
+    def get_scratch_root(cls):
+        '''directory for SPMF scratch files; memory-backed /dev/shm is used where available'''
+        if cls.scratch_root is not None:
+            return cls.scratch_root
+
+        shm = "/dev/shm"
+        if os.path.isdir(shm) and os.access(shm, os.W_OK):
+            return shm
 
-        return temp_file
+        return tempfile.gettempdir()
+
+    @classmethod
+    def scratch_directory(cls):
+        '''a new directory for the files of one SPMF run, removed with its contents when the with block exits'''
+        return tempfile.TemporaryDirectory(prefix=f"spmf_{os.getpid()}_", dir=cls.get_scratch_root())
 
     @classmethod
     def remove_non_maximal_patterns(cls, patterns, timestamps=None):
-        drop_indices = []
-        supersets = [x for x in patterns if len(x) > 1]
-        if supersets:
-            for i, p in enumerate(patterns):
-                for s in supersets:
-                    if p < s: # For sets < checks if proper subset
-                        drop_indices.append(i)
-                        break
-
-        for i in reversed(drop_indices):
-            del patterns[i]
-            if timestamps is not None:
-                del timestamps[i]
+        '''Remove patterns which are a proper subset of a pattern with more than one item, in place.
+           Patterns are held as bitsets of items. The subsets of each larger pattern are enumerated once,
+           so each pattern is checked with a single lookup'''
+        item_bits = {}
+        masks = []
+        for pattern in patterns:
+            mask = 0
+            for item in pattern:
+                mask |= 1 << item_bits.setdefault(item, len(item_bits))
+
+            masks.append(mask)
+
+        supersets = {mask for pattern, mask in zip(patterns, masks) if len(pattern) > 1}
+        proper_subsets = set()
+        large_supersets = []
+        for superset in supersets:
+            if bin(superset).count('1') > cls.MAX_ENUMERATED_PATTERN_ITEMS:
+                large_supersets.append(superset)
+                continue
+
+            subset = (superset - 1) & superset
+            while True:
+                proper_subsets.add(subset)
+                if subset == 0:
+                    break
+
+                subset = (subset - 1) & superset
+
+        keep = [i for i, mask in enumerate(masks)
+                if mask not in proper_subsets and not any(mask & x == mask and mask != x for x in large_supersets)]
+        if len(keep) == len(patterns):
+            return
+
+        patterns[:] = [patterns[i] for i in keep]
+        if timestamps is not None:
+            timestamps[:] = [timestamps[i] for i in keep]
 
     @classmethod
     def combine_overlapping_timestamped_patterns(cls, patterns, timestamps, tolerance=0):
         '''first combine timestamps, then get patterns within those timestamps
-           expects a list of 2-tuples'''
-        patterns = [set(x) for x in patterns]
-        if len(patterns) >= 1:
-            timestamps, patterns = (list(t) for t in zip(*sorted(zip(timestamps, patterns))))
-        if len(patterns) > 1:
-            reduced_stamps = [list(timestamps[0])]
-            reduced_patterns = [patterns[0]]
-            for i, current in enumerate(timestamps[1:]):
-                idx = i + 1
-                previous = reduced_stamps[-1]
-                if cls.check_overlap(previous[0], previous[1], current[0], current[1], tol=tolerance):
-                    previous[1] = max(current[1], previous[1])
-                    reduced_patterns[-1].update(patterns[idx])
-                else:
-                    reduced_stamps.append(list(current))
-                    reduced_patterns.append(patterns[idx])
-        else:
-            reduced_patterns = patterns
-            reduced_stamps = timestamps
+           expects a list of 2-tuples, each with start <= end.
+           Timestamps are swept in order of start; a timestamp joins the current group if it starts
+           no more than tolerance after the latest end in the group'''
+        if len(patterns) == 0:
+            return [], []
+
+        stamps = np.asarray(timestamps, dtype=np.int64).reshape(-1, 2)
+        order = np.lexsort((stamps[:, 1], stamps[:, 0]))
+        starts = stamps[order, 0]
+        ends = stamps[order, 1]
+        latest_end = np.maximum.accumulate(ends)
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = starts[1:] > latest_end[:-1] + tolerance
+        group_starts = np.flatnonzero(new_group)
+        groups = np.cumsum(new_group) - 1
+        reduced_stamps = list(zip(starts[group_starts].tolist(), np.maximum.reduceat(ends, group_starts).tolist()))
+
+        pattern_items = [list(patterns[i]) for i in order]
+        item_groups = np.repeat(groups, [len(x) for x in pattern_items])
+        item_codes, item_names = FormatSpmf.encode_items([x for items in pattern_items for x in items])
+        n_items = max(len(item_names), 1)
+        group_items = np.unique(item_groups * n_items + item_codes)
+        item_offsets = np.zeros(len(group_starts) + 1, dtype=np.int64)
+        item_offsets[1:] = np.cumsum(np.bincount(group_items // n_items, minlength=len(group_starts)))
+        names = item_names[group_items % n_items]
+        reduced_patterns = [tuple(names[item_offsets[i]:item_offsets[i + 1]]) for i in range(len(group_starts))]
+
+        return reduced_patterns, reduced_stamps
+
+    @classmethod
+    def mine_local_periodic_patterns(cls, sequence, timestamps, max_period, min_duration, max_spill, algorithm="LPPGrowth", backend=None):
+        '''returns a pattern set and (start, end) interval for each local periodic interval found'''
+        backend = cls.backend if backend is None else backend
+        if backend == MiningBackend.SPMF:
+            return cls.mine_local_periodic_patterns_spmf(sequence, timestamps, max_period, min_duration, max_spill, algorithm)
 
-        return [tuple(sorted(x)) for x in reduced_patterns], [tuple(x) for x in reduced_stamps]
+        patterns = []
+        intervals = []
+        for itemset, itemset_intervals in LppGrowth(max_period, min_duration, max_spill).mine(sequence, timestamps):
+            for interval in itemset_intervals:
+                patterns.append(set(itemset))
+                intervals.append(interval)
+
+        return patterns, intervals
 
     @classmethod
-    def mine_local_periodic_patterns(cls, sequence, timestamps, max_period, min_duration, max_spill, algorithm="LPPGrowth"):
-            lines = FormatSpmf.convert_to_spmf_episode(sequence, timestamps)
-            temp_file = cls.generate_file_name()
+    def mine_local_periodic_patterns_spmf(cls, sequence, timestamps, max_period, min_duration, max_spill, algorithm="LPPGrowth"):
+        lines = FormatSpmf.convert_to_spmf_episode(sequence, timestamps)
+        with cls.scratch_directory() as scratch:
+            input_file = cls.write_input_file(scratch, lines)
             pattern_miner = Spmf(algorithm,
-                                    input_direct=lines,
-                                    output_filename=temp_file,
-                                    arguments=[max_period, min_duration, max_spill, False])
+                                 input_filename=input_file,
+                                 output_filename=os.path.join(scratch, "output.txt"),
+                                 arguments=[max_period, min_duration, max_spill, False])
             pattern_miner.run()
             patterns, timestamps = FormatSpmf.parse_timestamped_spmf_output(pattern_miner.parse_output())
-            os.remove(temp_file)
 
-            return patterns, timestamps
+        return patterns, timestamps
+
+    @classmethod
+    def mine_local_periodic_patterns_batch(cls, episodes, max_period, min_duration, max_spill, algorithm="LPPGrowth", backend=None):
+        '''local periodic patterns for each (sequence, timestamps) pair, in order.
+           With the SPMF backend every sequence is mined by one Java process where java is a JDK, see SpmfBatch'''
+        backend = cls.backend if backend is None else backend
+        if backend != MiningBackend.SPMF:
+            return [cls.mine_local_periodic_patterns(x, y, max_period, min_duration, max_spill, backend=backend)
+                    for x, y in episodes]
+
+        with cls.scratch_directory() as job_dir:
+            batch = SpmfBatch(job_dir)
+            outputs = [batch.add_job(algorithm,
+                                     FormatSpmf.convert_to_spmf_episode(x, y),
+                                     [max_period, min_duration, max_spill, False]) for x, y in episodes]
+            batch.run()
+
+            return [FormatSpmf.parse_timestamped_spmf_output(SpmfBatch.read_output(x)) for x in outputs]
 
     @classmethod
-    def write_input_file(cls, output_file, sequences):
-        input_file = f"input_{output_file}.txt"
+    def write_input_file(cls, directory, sequences):
+        input_file = os.path.join(directory, "input.txt")
         with open(input_file, 'w+') as f:
             f.write(sequences)
 
         return input_file
 
     @classmethod
-    def mine_spam(cls, sequences, args, output_file=None, remove_output_file=True):
-        if output_file is None:
-            output_file = cls.generate_file_name()
+    def write_spam_output(cls, output_file, df):
+        '''write mined patterns in the SPMF CM-SPAM output format'''
+        with open(output_file, 'w+') as f:
+            for row in df.itertuples(index=False):
+                line = ' -1 '.join(row.pattern) + f" -1 #SUP: {row.sup}"
+                if "sid" in df.columns:
+                    line += " #SID: " + ' '.join(row.sid)
+
+                f.write(line + '\n')
+
+    @classmethod
+    def mine_spam(cls, sequences, args, output_file=None, remove_output_file=True, backend=None):
+        '''CM-SPAM sequential patterns for a list of sequences of space-separated itemsets.
+           args are the SPMF CM-SPAM arguments; the output file is only written in-process if it is kept'''
+        backend = cls.backend if backend is None else backend
+        if backend == MiningBackend.SPMF:
+            return cls.mine_spam_spmf(sequences, args, output_file, remove_output_file)
+
+        miner, show_sids = CmSpam.from_spmf_arguments(args)
+        records = [([' '.join(x) for x in pattern], support, [str(x) for x in sids])
+                   for pattern, support, sids in miner.mine(sequences)]
+        df = pd.DataFrame.from_records(records, columns=["pattern", "sup", "sid"])
+        df["sup"] = df["sup"].astype(int)
+        if not show_sids:
+            df = df.drop(columns="sid")
+
+        if output_file is not None and not remove_output_file:
+            cls.write_spam_output(output_file, df)
 
+        return df
+
+    @classmethod
+    def read_spam_output(cls, output_file, show_sids):
+        '''parse a CM-SPAM output file into the pattern dataframe returned by mine_spam'''
+        if show_sids:
+            return FormatSpmf.parse_spam_with_row_occurrences(output_file)
+
+        records = [(x[:-1], int(x[-1].split()[1])) for x in SpmfBatch.read_output(output_file)]
+
+        return pd.DataFrame.from_records(records, columns=["pattern", "sup"])
+
+    @classmethod
+    def mine_spam_batch(cls, jobs, backend=None):
+        '''CM-SPAM patterns for each (sequences, args) job, in order.
+           With the SPMF backend every job is run by one Java process where java is a JDK, see SpmfBatch'''
+        backend = cls.backend if backend is None else backend
+        if backend != MiningBackend.SPMF:
+            return [cls.mine_spam(x, y, backend=backend) for x, y in jobs]
+
+        with cls.scratch_directory() as job_dir:
+            batch = SpmfBatch(job_dir)
+            outputs = [batch.add_job("CM-SPAM", FormatSpmf.convert_to_spmf_standard(x), y) for x, y in jobs]
+            batch.run()
+
+            return [cls.read_spam_output(x, y[-1]) for x, (_, y) in zip(outputs, jobs)]
+
+    @classmethod
+    def mine_spam_spmf(cls, sequences, args, output_file=None, remove_output_file=True):
+        '''CM-SPAM patterns from SPMF. Files are written to a scratch directory;
+           the output file is only written to output_file if it is kept'''
         formatted_sequences = FormatSpmf.convert_to_spmf_standard(sequences)
-        input_file = cls.write_input_file(output_file, formatted_sequences)
-        pattern_miner = Spmf("CM-SPAM", input_filename=input_file, output_filename=output_file, arguments=args)
-        pattern_miner.run()
+        with cls.scratch_directory() as scratch:
+            if output_file is None or remove_output_file:
+                output_file = os.path.join(scratch, "output.txt")
 
-        if args[-1]:
-            df = FormatSpmf.parse_spam_with_row_occurrences(output_file)
-        else:
-            df = pattern_miner.to_pandas_dataframe()
-            test = [tuple(x) for x in df['pattern'].values]
-            q = {}
-            for x in test:
-                q[x] = (q.get(x, 0)) + 1
-            if any(val > 1 for val in q.values()):
-                x = 1
-
-        os.remove(input_file)
-        if remove_output_file:
-            os.remove(output_file)
+            input_file = cls.write_input_file(scratch, formatted_sequences)
+            pattern_miner = Spmf("CM-SPAM", input_filename=input_file, output_filename=output_file, arguments=args)
+            pattern_miner.run()
+            df = cls.read_spam_output(output_file, args[-1])
 
         return df
@@ -0,0 +1,93 @@
+'''Run many SPMF jobs with a single Java process'''
+import os
+import subprocess
+from pathlib import Path
+import spmf
+
+class SpmfBatch:
+    '''Collects SPMF jobs in a job directory and runs them all in one JVM, or one SPMF process per job with a JRE.
+       Inputs are written to the job directory when added, and outputs are read back in the order jobs were added'''
+    DRIVER = Path(__file__).parent / "SpmfBatch.java"
+    JOB_FILE = "jobs.tsv"
+    driver_launchable = None
+
+    def __init__(self, job_dir, spmf_bin_location_dir=".", memory=0):
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.executable = self.find_executable(spmf_bin_location_dir)
+        self.memory = memory
+        self.jobs = []
+
+    @staticmethod
+    def find_executable(spmf_bin_location_dir="."):
+        '''location of spmf.jar, searched for in the same places as the spmf package'''
+        for location in [spmf_bin_location_dir, os.path.dirname(os.path.realpath(spmf.__file__))]:
+            executable = Path(location) / "spmf.jar"
+            if executable.is_file():
+                return executable
+
+        raise FileNotFoundError("spmf.jar not found. Please use the spmf_bin_location_dir argument.")
+
+    def add_job(self, algorithm, input_text, arguments):
+        '''write the input for a job and return the file its output will be written to'''
+        n = len(self.jobs)
+        input_file = self.job_dir / f"input_{n}.txt"
+        output_file = self.job_dir / f"output_{n}.txt"
+        with open(input_file, 'w+') as f:
+            f.write(input_text)
+
+        arguments = [str(x) for x in arguments]
+        if any('\t' in x or '\n' in x for x in arguments):
+            raise ValueError(f"SPMF arguments cannot contain tabs or new lines: {arguments}")
+
+        self.jobs.append((algorithm, str(input_file), str(output_file), arguments))
+
+        return output_file
+
+    @classmethod
+    def can_launch_driver(cls):
+        '''True if java can run the driver from source, which needs the compiler module of a JDK rather than a JRE'''
+        if cls.driver_launchable is None:
+            modules = subprocess.run(["java", "--list-modules"], capture_output=True, text=True).stdout
+            cls.driver_launchable = any(x.split('@')[0] == "jdk.compiler" for x in modules.split())
+
+        return cls.driver_launchable
+
+    def write_job_file(self):
+        '''the job file read by the driver, with one tab-separated line per job'''
+        job_file = self.job_dir / self.JOB_FILE
+        with open(job_file, 'w+') as f:
+            for algorithm, input_file, output_file, arguments in self.jobs:
+                f.write('\t'.join([algorithm, input_file, output_file] + arguments) + '\n')
+
+        return job_file
+
+    def run(self):
+        '''Run every job, in one JVM if java can launch the driver and otherwise with one SPMF process per job.
+           Jobs which find no patterns are given an empty output file'''
+        if not self.jobs:
+            return
+
+        java = ["java"]
+        if self.memory:
+            java.append(f"-Xmx{self.memory}m")
+
+        if self.can_launch_driver():
+            commands = [java + ["-cp", str(self.executable), str(self.DRIVER), str(self.write_job_file())]]
+        else:
+            commands = [java + ["-jar", str(self.executable), "run", algorithm, input_file, output_file] + arguments
+                        for algorithm, input_file, output_file, arguments in self.jobs]
+
+        for command in commands:
+            proc_output = subprocess.check_output(command).decode()
+            if "java.lang.IllegalArgumentException" in proc_output:
+                raise TypeError("java.lang.IllegalArgumentException")
+
+        for _, _, output_file, _ in self.jobs:
+            Path(output_file).touch()
+
+    @staticmethod
+    def read_output(output_file):
+        '''output lines split into itemsets, as in Spmf.parse_output'''
+        with open(output_file, 'r') as f:
+            return [line.strip().split(" -1 ") for line in f]
@@ -1,12 +1,45 @@
 '''similarity calculations'''
+import multiprocessing as mp
 from typing import List
 from math import log
+import numpy as np
 import pandas as pd
 from numpy import NaN
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 
 
+class RunningOverlap:
+    '''Tracks the items seen so far in two rankings and the size of their overlap,
+       so each depth of a ranking comparison only adds the new items'''
+    def __init__(self):
+        self.S = set()
+        self.T = set()
+        self.overlap = 0
+
+    def add(self, s_items, t_items):
+        '''add the items at the next depth of each ranking'''
+        for x in s_items:
+            if x not in self.S:
+                self.S.add(x)
+                if x in self.T:
+                    self.overlap += 1
+
+        for x in t_items:
+            if x not in self.T:
+                self.T.add(x)
+                if x in self.S:
+                    self.overlap += 1
+
+        return self.overlap
+
+def cumulative_overlap(s: list, t: list) -> List[int]:
+    '''returns the size of the overlap of two rankings at each depth, to the length of the longer ranking'''
+    running = RunningOverlap()
+    overlaps = []
+    for d in range(max(len(s), len(t))):
+        overlaps.append(running.add(s[d:d+1], t[d:d+1]))
+
+    return overlaps
+
 def average_overlap(s: list, t: list):
     '''returns the average overlap of two equal-length lists of rankings'''
     if len(s) != len(t):
@@ -14,11 +47,8 @@ def average_overlap(s: list, t: list):
 
     summation = 0
     k = len(s)
-    for d in range(1, k+1):
-        S = set(s[:d])
-        T = set(t[:d])
-        overlap = S.intersection(T)
-        fraction = len(overlap) / d
+    for d, overlap in enumerate(cumulative_overlap(s, t), start=1):
+        fraction = overlap / d
         summation += fraction
 
     return summation / k
@@ -29,70 +59,219 @@ def rbo(s: list, t: list, p: float):
         raise NotImplementedError("RBO not implemented for lists of different lengths")
 
     summation = 0
-    k = len(s)
-    for d in range(1, k+1):
-        S = set(s[:d])
-        T = set(t[:d])
-        overlap = S.intersection(T)
+    for d, overlap in enumerate(cumulative_overlap(s, t), start=1):
         p_d = p ** (d - 1)
-        fraction = p_d * len(overlap) / d
+        fraction = p_d * overlap / d
         summation += fraction
 
     return (1 -p) * summation
 
+def rbo_ext(s: list, t: list, p: float):
+    '''returns the extrapolated rank-biased overlap of two lists of rankings, which may have different lengths.
+       Agreement at the end of the shorter list is assumed to continue to the end of the longer list (Webber et al., eq. 32).
+       p must be greater than 0'''
+    short, long = (s, t) if len(s) <= len(t) else (t, s)
+    n_short = len(short)
+    n_long = len(long)
+    if n_short == 0:
+        return 0
+
+    overlaps = cumulative_overlap(short, long)
+    x_short = overlaps[n_short - 1]
+    x_long = overlaps[-1]
+    summation = 0
+    for d, overlap in enumerate(overlaps, start=1):
+        summation += overlap / d * p ** d
+        if d > n_short:
+            summation += x_short * (d - n_short) / (n_short * d) * p ** d
+
+    return (1 - p) / p * summation + ((x_long - x_short) / n_long + x_short / n_short) * p ** n_long
+
+class TiedRanking:
+    '''A ranking with ties, stored as the items in rank order and the position where each tie group starts.
+       Equivalent to the list of lists used by rbo_with_ties, where n tied items are followed by n - 1 empty lists,
+       without building the empty lists. Group i holds items[starts[i]:starts[i + 1]]'''
+    def __init__(self, items, starts, length=None):
+        self.items = np.asarray(items, dtype=object)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.length = len(self.items) if length is None else length
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sort=True):
+        '''Rank the index values of a series by descending value, with equal values tied.
+           With sort False the series should already be in rank order'''
+        if sort:
+            series = series.sort_values(ascending=False)
+
+        values = series.to_numpy()
+        changes = np.ones(len(values), dtype=bool)
+        changes[1:] = values[1:] != values[:-1]
+
+        return cls(series.index.to_numpy(), np.flatnonzero(changes))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.start not in (None, 0) or key.step not in (None, 1):
+                raise NotImplementedError("Only the top of a tied ranking can be sliced")
+
+            length = self.length if key.stop is None else max(0, min(key.stop, self.length))
+            n_groups = np.searchsorted(self.starts, length)
+            end = self.starts[n_groups] if n_groups < len(self.starts) else len(self.items)
+
+            return TiedRanking(self.items[:end], self.starts[:n_groups], length)
+
+        position = range(self.length)[key]
+        group = np.searchsorted(self.starts, position)
+        if group == len(self.starts) or self.starts[group] != position:
+            return []
+
+        return self.groups()[group].tolist()
+
+    def groups(self):
+        '''the items in each tie group'''
+        return np.split(self.items, self.starts[1:])
+
+    def item_starts(self):
+        '''the position of the tie group of each item'''
+        sizes = np.diff(np.append(self.starts, len(self.items)))
+
+        return np.repeat(self.starts, sizes)
+
+    def tolist(self) -> List[List]:
+        '''convert to the list of lists format'''
+        ranking = [[] for _ in range(self.length)]
+        for start, group in zip(self.starts, self.groups()):
+            ranking[start] = group.tolist()
+
+        return ranking
+
+def tied_ranking_rbo(s: TiedRanking, t: TiedRanking, p: float):
+    '''rbo_with_ties for two TiedRankings of equal length.
+       The overlap only changes where a tie group starts, so it is counted at those depths with NumPy
+       and the weights of the depths up to the next group are summed as a geometric series'''
+    k = len(s)
+    if k == 0:
+        return 0
+
+    s_index = pd.Index(s.items)
+    if not (s_index.is_unique and pd.Index(t.items).is_unique):
+        return rbo_with_ties(s.tolist(), t.tolist(), p)
+
+    s_entry = s.item_starts()
+    t_entry = t.item_starts()
+    matches = s_index.get_indexer(t.items)
+    shared = matches >= 0
+    overlap_entry = np.sort(np.maximum(s_entry[matches[shared]], t_entry[shared]))
+    events = np.union1d(s.starts, t.starts)
+    overlap = np.searchsorted(overlap_entry, events, side='right')
+    n_items = np.searchsorted(s_entry, events, side='right') + np.searchsorted(t_entry, events, side='right')
+    agreements = 2 * overlap / n_items
+    ends = np.append(events[1:], k)
+
+    return float(np.sum(agreements * (p ** events - p ** ends)))
+
 def rbo_with_ties(s: list, t: list, p: float):
     '''returns the rank-biased overlap of two equal-length lists of lists of rankings, weighted by p
        each list should be a list of lists, with ties placed inside the sublist
-       empty sublists follow for the number of ties'''
+       empty sublists follow for the number of ties
+       two TiedRankings can be used instead of lists'''
     if len(s) != len(t):
         raise NotImplementedError("RBO not implemented for lists of different lengths")
 
+    if isinstance(s, TiedRanking) and isinstance(t, TiedRanking):
+        return tied_ranking_rbo(s, t, p)
+
     summation = 0
-    k = len(s)
-    for d in range(1, k+1):
-        S = set([x for l in s[:d] for x in l])
-        T = set([x for l in t[:d] for x in l])
-        overlap = S.intersection(T)
+    running = RunningOverlap()
+    for d, (s_items, t_items) in enumerate(zip(s, t), start=1):
+        overlap = running.add(s_items, t_items)
         p_d = p ** (d - 1)
-        fraction = p_d * 2 * len(overlap) / (len(S) + len(T))
+        fraction = p_d * 2 * overlap / (len(running.S) + len(running.T))
         summation += fraction
 
     return (1 -p) * summation
 
-def convert_series_to_tied_list(series: pd.Series) -> List[List]:
-    '''Convert a pandas series to a tied list suitable for rbo_with_ties of the index values,
-       using the series values to determine rank'''
-    series = series.sort_values(ascending=False)
-    ret = []
-    current_score = series.max()
-    current_idxs = []
-    for (idx, val) in series.items():
-        if val != current_score:
-            ret.append(current_idxs)
-            for _ in range(len(current_idxs) - 1):
-                ret.append([])
+_worker_rankings = None
 
-            current_idxs = []
-            current_score = val
+def set_worker_rankings(rankings):
+    '''store the rankings in a similarity matrix worker, so they are sent once per process rather than once per pair'''
+    global _worker_rankings # pylint: disable=global-statement ## process pool initialiser
+    _worker_rankings = rankings
 
-        current_idxs.append(idx)
+def pair_similarity(args):
+    '''similarity between two of the worker's rankings'''
+    i, j, similarity, kwargs = args
 
-    ret.append(current_idxs)
-    for _ in range(len(current_idxs) - 1):
-        ret.append([])
+    return i, j, similarity(_worker_rankings[i], _worker_rankings[j], **kwargs)
 
-    return ret
+def similarity_matrix(rankings: list, labels=None, similarity=rbo_with_ties, n_processes=0, previous=None, **kwargs) -> pd.DataFrame:
+    '''Returns a symmetric DataFrame of the similarity between each pair of rankings, labelled by labels.
+       Each ranking is compared to itself and each unordered pair is compared once.
+       Values for pairs of labels in a previous matrix are reused rather than recalculated.
+       kwargs are passed to the similarity function, which must be picklable if n_processes is above 0'''
+    n = len(rankings)
+    labels = list(range(n)) if labels is None else list(labels)
+    matrix = pd.DataFrame(NaN, index=labels, columns=labels, dtype=float)
+    jobs = []
+    for i in range(n):
+        for j in range(i, n):
+            value = NaN
+            if previous is not None and labels[i] in previous.index and labels[j] in previous.columns:
+                value = previous.at[labels[i], labels[j]]
+
+            if pd.isna(value):
+                jobs.append((i, j, similarity, kwargs))
+            else:
+                matrix.iat[i, j] = matrix.iat[j, i] = value
+
+    if n_processes and jobs:
+        chunksize = max(1, len(jobs) // (4 * n_processes))
+        with mp.Pool(n_processes, initializer=set_worker_rankings, initargs=(rankings,)) as pool:
+            results = list(pool.imap_unordered(pair_similarity, jobs, chunksize=chunksize))
+    else:
+        results = [(i, j, similarity(rankings[i], rankings[j], **kwargs)) for i, j, _, _ in jobs]
+
+    for i, j, value in results:
+        matrix.iat[i, j] = matrix.iat[j, i] = value
+
+    return matrix
+
+def get_unchanged_similarities(previous: pd.DataFrame, previous_versions: dict, versions: dict):
+    '''Returns the part of a previous similarity matrix which is still valid, and the versions of its rankings.
+       Versions identify the content of each labelled ranking, such as a hash of its file.
+       Labels are dropped if their ranking has changed or the previous version is unknown;
+       labels not in versions are kept, as they may be compared again in a later run'''
+    if previous is None:
+        return None, {}
+
+    unchanged = [x for x in previous.index
+                 if x in previous_versions and versions.get(x, previous_versions[x]) == previous_versions[x]]
+
+    return previous.loc[unchanged, unchanged], {x: previous_versions[x] for x in unchanged}
+
+def convert_series_to_tied_list(series: pd.Series) -> List[List]:
+    '''Convert a pandas series to a tied list suitable for rbo_with_ties of the index values,
+       using the series values to determine rank'''
+    return TiedRanking.from_series(series).tolist()
 
 def rbo_weight_at_depth(p, depth):
-    left_part = 1 - p**(depth - 1)
-    mid_part = (1 - p) * depth / p
+    '''returns the weight of the first depth ranks in rbo with parameter p, for a single depth or an array of depths'''
+    depths = np.asarray(depth)
+    i = np.arange(1, max(int(depths.max()), 1))
+    partial_sums = np.concatenate(([0.0], np.cumsum(p ** i / i)))
+    left_part = 1 - p**(depths - 1)
+    mid_part = (1 - p) * depths / p
     right_part_left = log(1 / (1 - p))
-    right_part_right = 0
-    for i in range(1, depth):
-        right_part_right += p**i / i
+    right_part_right = partial_sums[depths - 1]
+    weight = left_part + mid_part * (right_part_left - right_part_right)
+
+    return float(weight) if weight.ndim == 0 else weight
 
-    return left_part + mid_part * (right_part_left - right_part_right)
 def one_way_anova(df, output_path, index_name="index"):
+    import pingouin as pg # pylint: disable=import-outside-toplevel ## slow import only needed here
     melt = pd.melt(df.reset_index(), id_vars=["index"], value_vars=df.columns)
     res = pg.rm_anova(dv="value", within="variable", subject="index", data=melt, detailed=True)
     path = output_path / 'pingouin_rm_anova.csv'
@@ -24,10 +24,12 @@ class AnalysisBaseAttributes:
 
         self.test_hash = _hash(details)
         self.logger = logger
-        self.code_converter = CodeConverter(years[-1])
+        self.code_converter = CodeConverter.get(years[-1])
         self.plots = PlotUtils(logger)
         self.graphs = MbsGraphColouring(logger, self.code_converter)
         self.test_details = details
+        self.years = years
         self.start_year = years[0]
         self.end_year = years[-1]
         self.data: pd.DataFrame = None
+
@@ -49,11 +49,7 @@ class FileUtils:
         '''Save a graph model'''
         header = "Item is commonly claimed during unliateral joint replacements in the state " \
                 + "on the surgery date of service\n"
+        report = code_converter.create_mbs_code_report(list(d), fees=False)
         with open(filename, 'w+') as f:
             f.write(header)
-            subheader = "Category,Group,Sub-group,Item,Description\n"
-            f.write(f'{subheader}')
-            for node in d:
-                line = code_converter.get_mbs_code_as_line(node)
-                line = ','.join(line)
-                f.write(f"{line}\n")
+            report.to_csv(f, index=False)
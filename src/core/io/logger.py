@@ -8,13 +8,15 @@ import sys
 from datetime import datetime
 from distutils.dir_util import copy_tree
 from pathlib import Path
+from src.core.io.render_queue import RenderQueue
 
 class LoggingStructure:
     '''Create the logging structure on enter'''
-    def __init__(self, test_name, copy_path=None):
+    def __init__(self, test_name, copy_path=None, render_processes=2):
         self.copy_path = copy_path
         self.test_name = test_name
         self.output_path = self.create_output_folder(test_name)
+        self.render_queue = RenderQueue(self, render_processes)
         sys.excepthook = self.handle_exception
         self.file_name = self.output_path / f"{test_name}.log"
         self.logger = logging.getLogger()
@@ -27,6 +29,7 @@ class LoggingStructure:
 
     def finalise(self):
         '''Copy directory and finish log at test end'''
+        self.render_queue.join()
         self.log("Finalising")
         if self.copy_path is not None:
             if not isinstance(self.copy_path, str):
@@ -85,14 +88,15 @@ class LoggingStructure:
 
 class Logger:
     '''Logging functions and output path'''
-    def __init__(self, test_name, copy_path=None):
+    def __init__(self, test_name, copy_path=None, render_processes=2):
         # self.name = name
         self.test_name = test_name
         self.copy_path = copy_path
+        self.render_processes = render_processes
         self.logger: LoggingStructure
 
     def __enter__(self):
-        self.logger = LoggingStructure(self.test_name, self.copy_path)
+        self.logger = LoggingStructure(self.test_name, self.copy_path, self.render_processes)
 
         return self.logger
 
@@ -0,0 +1,113 @@
+'''Queue for rendering graph images in background processes'''
+import multiprocessing as mp
+from dataclasses import dataclass
+from enum import Enum
+from time import perf_counter
+
+class RenderEngine(Enum):
+    '''ways of producing graph output'''
+    GRAPHVIZ = 0
+    VISNETWORK = 1
+    DOT = 2
+
+@dataclass
+class RenderPolicy:
+    '''Controls which engines render a graph and how much time each render may take.
+       Graphs with more than max_layout_nodes nodes are saved as DOT text only.
+       Graphviz layouts are killed when they exceed time_budget seconds;
+       visNetwork runs inside R and cannot be interrupted, so overruns are only reported.'''
+    engines: tuple = (RenderEngine.GRAPHVIZ, RenderEngine.VISNETWORK)
+    time_budget: float = None
+    max_layout_nodes: int = None
+
+    def select_engines(self, n_nodes):
+        '''returns the engines to use for a graph with n_nodes nodes'''
+        if self.max_layout_nodes is None or n_nodes <= self.max_layout_nodes:
+            return self.engines
+
+        return (RenderEngine.DOT,)
+
+def run_render_job(name, func, args, kwargs, time_budget=None):
+    '''run a single render job, returning any error rather than raising it in the worker'''
+    start = perf_counter()
+    try:
+        func(*args, **kwargs)
+    except Exception as e: # pylint: disable=broad-except ## failed renders should not stop the analysis
+        return name, perf_counter() - start, f"{type(e).__name__}: {e}"
+
+    elapsed = perf_counter() - start
+    if time_budget is not None and elapsed > time_budget:
+        return name, elapsed, f"exceeded time budget of {time_budget}s"
+
+    return name, elapsed, None
+
+class RenderQueue:
+    '''Sends graph rendering jobs to a process pool so the analysis can continue while images are produced.
+       Jobs are pickled by the pool in the background some time after submission, so arguments should not be modified
+       after submission. Jobs which cannot be pickled are reported as failed renders when the queue is joined.
+       With n_processes set to 0 jobs are rendered immediately in the calling process.'''
+    def __init__(self, logger, n_processes=2):
+        self.logger = logger
+        self.n_processes = n_processes
+        self.pool = None
+        self.pending = []
+        self.failures = []
+        self.total_time = 0.0
+
+    def __getstate__(self):
+        '''the pool and pending jobs stay with the parent process when the owning logger is pickled'''
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["pending"] = []
+
+        return state
+
+    def log(self, text):
+        '''log to the owning logger'''
+        if self.logger is not None:
+            self.logger.log(text)
+
+    def submit(self, name, func, *args, time_budget=None, **kwargs):
+        '''queue func(*args, **kwargs) for rendering'''
+        if not self.n_processes:
+            self.handle_result(run_render_job(name, func, args, kwargs, time_budget))
+
+            return
+
+        if self.pool is None:
+            self.pool = mp.Pool(self.n_processes)
+
+        self.pending.append((name, self.pool.apply_async(run_render_job, (name, func, args, kwargs, time_budget))))
+
+    def handle_result(self, result):
+        '''record the outcome and timing of a finished render job'''
+        name, elapsed, error = result
+        self.total_time += elapsed
+        self.log(f"Rendered {name} in {elapsed:.2f}s")
+        if error is not None:
+            self.failures.append((name, error))
+
+    def join(self):
+        '''wait for all queued jobs to finish, shut down the pool, and log any failures'''
+        if self.pool is not None:
+            self.log(f"Waiting for {len(self.pending)} queued render jobs")
+            self.pool.close()
+            for name, job in self.pending:
+                try:
+                    result = job.get()
+                except Exception as e: # pylint: disable=broad-except ## e.g. unpicklable arguments should not stop the other renders
+                    result = (name, 0.0, f"{type(e).__name__}: {e}")
+
+                self.handle_result(result)
+
+            self.pool.join()
+            self.pool = None
+            self.pending = []
+            self.log(f"Total render time {self.total_time:.2f}s")
+
+        if self.failures:
+            self.log(f"{len(self.failures)} render jobs failed")
+            for name, error in self.failures:
+                self.log(f"Rendering {name} failed: {error}")
+
+            self.failures = []
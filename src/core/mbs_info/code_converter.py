@@ -1,29 +1,42 @@
 '''Code converter class for PBS items and MBS RSP codes'''
 import re
 import pickle
-import pandas as pd
+from collections import defaultdict
+from functools import cached_property, partial
 from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.core.io.file_utils import FileUtils
+from src.core.mbs_info.mbs_snapshot import MbsItemStore, read_snapshot, write_snapshot
 
 class CodeConverter:
     '''Converter for PBS items and MBS RSP codes'''
-    def __init__(self, year):
-        year = str(year)
-        available_years = ['2014', '2019', '2021']
-        if year not in available_years:
-            year = '2019'
-
+    MBS_ITEM_TABLE_COLUMNS = ["Fee", "FeeType", "FeeStartDate",
+                              "Category", "Group", "SubGroup", "SubHeading",
+                              "CategoryLabel", "GroupLabel", "SubGroupLabel", "SubHeadingLabel",
+                              "OntologyLabel", "Description"]
+
+    MBS_GROUP_COLUMNS = ["Category", "Group", "SubGroup", "SubHeading"]
+    MBS_REPORT_COLUMNS = {"CategoryLabel": "Category",
+                          "GroupLabel": "Group",
+                          "SubGroupLabel": "Sub-group",
+                          "SubHeadingLabel": "Sub-heading",
+                          "Description": "Description"}
+    CONVERTER_PATH = Path(__file__).parent
+    SNAPSHOT_PATH = FileUtils.get_project_root() / 'data' / 'mbs_snapshots'
+    _shared = {}
+
+    def __init__(self, year, rebuild=False, schedule=None):
+        year = self.resolve_year(year)
         self.year = year
 
-        converter_path = Path(__file__).parent
+        converter_path = self.CONVERTER_PATH
         mbs_group_filename = converter_path / 'updated_group_info.pkl'
-        mbs_item_filename = converter_path / f'MBS_{year}.pkl'
+        self.mbs_item_filename = converter_path / f'MBS_{year}.pkl'
         rsp_filename = converter_path / 'SPR_RSP.csv'
         pbs_item_filename = converter_path / 'pbs_item_drug_map_2022.csv'
         pbs_atc_filename = converter_path / 'atc_codes.pqt'
 
-        with open(mbs_item_filename, 'rb') as f:
-            self.mbs_item_dict = pickle.load(f)
-
         with open(mbs_group_filename, 'rb') as f:
             self.mbs_groups_dict = pickle.load(f)
 
@@ -31,6 +44,150 @@ class CodeConverter:
         self.valid_rsp_num_values = self.rsp_table['SPR_RSP'].unique()
         self.valid_rsp_str_values = self.rsp_table['Label'].unique()
 
+        snapshot_sources = [self.mbs_item_filename, mbs_group_filename]
+        snapshot_path = self.SNAPSHOT_PATH / f'MBS_{year}'
+        self.mbs_item_store = None if rebuild else read_snapshot(snapshot_path, snapshot_sources)
+        if self.mbs_item_store is None:
+            table = self.create_mbs_item_table()
+            metadata = {"year": year, "schedule": schedule}
+            try:
+                write_snapshot(table, snapshot_path, snapshot_sources, metadata)
+                self.mbs_item_store = read_snapshot(snapshot_path, snapshot_sources)
+            except OSError:
+                if rebuild:
+                    raise
+
+            if self.mbs_item_store is None:
+                self.mbs_item_store = MbsItemStore.from_table(table)
+
+    def __reduce__(self):
+        '''pickle as the schedule year, so pool workers use their shared converter instead of a copy'''
+        return (type(self).get, (self.year,))
+
+    @classmethod
+    def available_years(cls):
+        '''Returns the schedule years with an MBS item dictionary'''
+        return sorted(x.stem.split('_', 1)[1] for x in cls.CONVERTER_PATH.glob('MBS_*.pkl'))
+
+    @classmethod
+    def resolve_year(cls, year):
+        '''Returns the schedule year used for a requested year'''
+        year = str(year)
+        if year not in cls.available_years():
+            year = '2019'
+
+        return year
+
+    @classmethod
+    def build_item_store(cls, year, schedule=None):
+        '''Rebuild the item store for a schedule year from its item dictionary, and share the new converter'''
+        converter = cls(year, rebuild=True, schedule=schedule)
+        cls._shared[converter.year] = converter
+
+        return converter
+
+    @classmethod
+    def get(cls, year):
+        '''Returns the converter for a schedule year, shared by everything in the process.
+           Forked workers inherit it and spawned workers load it from the snapshot'''
+        year = cls.resolve_year(year)
+        if year not in cls._shared:
+            cls._shared[year] = cls(year)
+
+        return cls._shared[year]
+
+    @cached_property
+    def mbs_item_table(self):
+        '''the whole precomputed item table, decoded from the item store on first use'''
+        return self.mbs_item_store.to_frame()
+
+    @cached_property
+    def mbs_hierarchy_index(self):
+        return self.create_mbs_hierarchy_index()
+
+    @cached_property
+    def mbs_item_dict(self):
+        '''the full MBS schedule, only loaded when the precomputed table needs to be built'''
+        with open(self.mbs_item_filename, 'rb') as f:
+            return pickle.load(f)
+
+    def lookup_mbs_group_labels(self, cat, group, sub, head):
+        '''Returns the labels for each level of an MBS group, with None for levels not in the group dictionary'''
+        labels = [None, None, None, None]
+        level = self.mbs_groups_dict
+        for i, key in enumerate([cat, group, sub, head]):
+            if key is None or key not in level:
+                break
+
+            level = level[key]
+            labels[i] = level["Label"]
+
+        return labels
+
+    def create_mbs_item_table(self):
+        '''Precompute fee, group and label information for every MBS item as a table indexed by item code'''
+        records = {}
+        for code, item in self.mbs_item_dict.items():
+            fee, fee_type = self.calculate_mbs_item_fee(code)
+            numbers = [item['Category'], item['Group'], item['SubGroup'], item['SubHeading']]
+            labels = self.lookup_mbs_group_labels(*numbers)
+            ontology = '_'.join(['None' if x is None else x for x in numbers])
+            records[code] = [fee, fee_type, item.get('FeeStartDate')] + numbers + labels + [ontology, item['Description']]
+
+        table = pd.DataFrame.from_dict(records, orient='index', columns=self.MBS_ITEM_TABLE_COLUMNS)
+        table["Fee"] = table["Fee"].astype(float)
+
+        return table
+
+    @staticmethod
+    def normalise_mbs_codes(codes):
+        '''Convert a series of item codes to dictionary keys, converting each unique code once'''
+        positions, uniques = pd.factorize(codes)
+        keys = np.array([str(int(x)) for x in uniques] + [None], dtype=object)
+
+        return pd.Series(keys[positions], index=codes.index)
+
+    def get_mbs_item_info(self, codes, columns=None):
+        '''Returns precomputed MBS item information for a series of codes, aligned with the series index.
+           Each unique code is converted once; rows for codes not in the dictionary are empty'''
+        if not isinstance(codes, pd.Series):
+            codes = pd.Series(codes)
+
+        positions, uniques = pd.factorize(codes)
+        keys = [str(int(x)) for x in uniques]
+        # the trailing empty row is selected by the -1 position factorize gives missing values
+        item_positions = np.append(self.mbs_item_store.find_items(keys), -1)
+        info = self.mbs_item_store.get_frame(item_positions[positions], columns, index=codes.index)
+
+        return info
+
+    def get_mbs_item_fees(self, codes):
+        '''Returns the fee and fee type for a series of MBS items.
+           Items not in the dictionary match get_mbs_item_fee; items without an accessible fee have a missing fee'''
+        fees = self.get_mbs_item_info(codes, ["Fee", "FeeType"])
+        missing = fees["FeeType"].isna()
+        fees.loc[missing, "Fee"] = 500
+        fees.loc[missing, "FeeType"] = "Not in dictionary"
+
+        return fees
+
+    @staticmethod
+    def convert_unique_codes(codes, converter):
+        '''Apply a single code conversion to each unique code in a series, returning a categorical series of the results.
+           Missing codes stay missing'''
+        if not isinstance(codes, pd.Series):
+            codes = pd.Series(codes)
+
+        positions, uniques = pd.factorize(codes)
+        labels = pd.Categorical([converter(x) for x in uniques])
+        label_codes = np.where(positions < 0, -1, labels.codes[positions])
+
+        return pd.Series(pd.Categorical.from_codes(label_codes, labels.categories), index=codes.index)
+
+    def convert_mbs_codes_to_ontology_labels(self, codes, level=4):
+        '''Returns the ontology labels for a series of MBS items as a categorical series'''
+        return self.convert_unique_codes(codes, partial(self.convert_mbs_code_to_ontology_label, level=level))
+
     def convert_mbs_category_number_to_label(self, cat_num):
         '''Returns a category label'''
         cat_num = str(cat_num)
@@ -43,22 +200,20 @@ class CodeConverter:
 
     def convert_mbs_code_to_description(self, code):
         '''Returns the description of an MBS item'''
-        item = self.mbs_item_dict.get(str(int(code)), None)
-        if item is None:
+        item = self.mbs_item_store.get_item(str(int(code)), ["Description"])
+        description = None if item is None else item[0]
+        if description is None:
             return f"Item code {code} not in {self.year} dictionary"
 
-        return f"{item['Description']}"
+        return f"{description}"
 
     def convert_mbs_code_to_group_labels(self, code):
         '''Returns the group description of an MBS item'''
-        item = self.mbs_item_dict.get(str(int(code)), None)
+        item = self.mbs_item_store.get_item(str(int(code)), self.MBS_GROUP_COLUMNS)
         if item is None:
             return [f"Item code {code} not in {self.year} dictionary"]
 
-        cat = item['Category']
-        group = item['Group']
-        sub = item['SubGroup']
-        head = item['SubHeading']
+        cat, group, sub, head = item
 
         cat_desc = self.mbs_groups_dict[cat]["Label"]
         group_desc = self.mbs_groups_dict[cat][group]["Label"]
@@ -87,15 +242,16 @@ class CodeConverter:
 
     def convert_mbs_code_to_group_numbers(self, code):
         '''convert mbs item code number to category definition'''
-        item = self.mbs_item_dict.get(str(int(code)), None)
+        item = self.mbs_item_store.get_item(str(int(code)), self.MBS_GROUP_COLUMNS)
         if item is None:
             return [f"Item code {code} not in {self.year} dictionary"]
 
-        return [item['Category'], item['Group'], item['SubGroup'], item['SubHeading']]
+        return list(item)
 
-    def convert_mbs_code_to_ontology_label(self, code):
+    def convert_mbs_code_to_ontology_label(self, code, level=4):
+        '''convert mbs item code to its location in the ontology, down to level 1 (category) to 4 (subheading)'''
         group = self.convert_mbs_code_to_group_numbers(code)
-        label = '_'.join(['None' if x is None else x for x in group])
+        label = '_'.join(['None' if x is None else x for x in group[:level]])
 
         return label
 
@@ -128,10 +284,21 @@ class CodeConverter:
 
     def get_mbs_item_fee(self, code):
         '''Return the fee amount and type for an MBS item'''
-        item = self.mbs_item_dict.get(str(int(code)), None)
+        code = str(int(code))
+        item = self.mbs_item_store.get_item(code, ["Fee", "FeeType"])
         if item is None:
             return 500, "Not in dictionary"
 
+        fee, fee_type = item
+        if fee != fee:
+            raise KeyError(f"{code} does not have an easily accessible fee")
+
+        return fee, fee_type
+
+    def calculate_mbs_item_fee(self, code):
+        '''Calculate the fee amount and type for an item in the MBS dictionary.
+           The fee is None if it cannot be found from the item information'''
+        item = self.mbs_item_dict[code]
         fee_type = "ScheduleFee"
         if "ScheduleFee" not in item:
             derived_fee = item["DerivedFee"]
@@ -146,8 +313,8 @@ class CodeConverter:
                 else:
                     try:
                         return float(re.search(r'\$(\d+\.\d+)', derived_fee)[1]), fee_type
-                    except TypeError as e:
-                        raise KeyError(f"{code} does not have an easily accessible fee") from e
+                    except TypeError:
+                        return None, fee_type
 
             item = self.mbs_item_dict.get(str(number), None)
 
@@ -156,22 +323,36 @@ class CodeConverter:
 
         return fee, fee_type
 
+    def create_mbs_hierarchy_index(self):
+        '''Index the items under every category, group, subgroup and subheading by the path of numbers to that level'''
+        store = self.mbs_item_store
+        positions = np.arange(len(store))
+        groups = zip(*[store.get_values(col, positions) for col in self.MBS_GROUP_COLUMNS])
+        index = defaultdict(set)
+        for code, numbers in zip(store.items.tolist(), groups):
+            for depth in range(1, len(numbers) + 1):
+                index[numbers[:depth]].add(code)
+
+        return {key: frozenset(items) for key, items in index.items()}
+
     def get_mbs_items_in_category(self, cat_no):
-        return [x for x, y in self.mbs_item_dict.items() if y["Category"] == str(cat_no)]
+        '''Returns the set of items in a category'''
+        return self.mbs_hierarchy_index.get((str(cat_no),), frozenset())
 
     def get_mbs_items_in_group(self, cat_no, group_id):
-        return [x for x, y in self.mbs_item_dict.items() if (y["Category"] == str(cat_no) and y["Group"] == group_id)]
+        '''Returns the set of items in a group'''
+        return self.mbs_hierarchy_index.get((str(cat_no), group_id), frozenset())
 
     def get_mbs_items_in_subgroup(self, cat_no, group_id, subgroup_no):
-        return [x for x, y in self.mbs_item_dict.items() if (y["Category"] == str(cat_no) and y["Group"] == group_id and y["SubGroup"] == str(subgroup_no))]
+        '''Returns the set of items in a subgroup'''
+        return self.mbs_hierarchy_index.get((str(cat_no), group_id, str(subgroup_no)), frozenset())
 
     def get_mbs_items_in_subheading(self, cat_no, group_id: str, subgroup_no, subheading_no):
+        '''Returns the set of items in a subheading'''
         subgroup_no = str(subgroup_no) if subgroup_no is not None else None
         subheading_no = str(subheading_no) if subheading_no is not None else None
-        return [x for x, y in self.mbs_item_dict.items() if (y["Category"] == str(cat_no)
-                                                             and y["Group"] == group_id
-                                                             and y["SubGroup"] == subgroup_no
-                                                             and y["SubHeading"] == subheading_no)]
+
+        return self.mbs_hierarchy_index.get((str(cat_no), group_id, subgroup_no, subheading_no), frozenset())
 
     def get_mbs_code_as_line(self, code):
         '''Get MBS item code information as a string formatted for printing'''
@@ -186,28 +367,57 @@ class CodeConverter:
 
         return mod_line
 
+    def create_mbs_code_report(self, codes, additional_cols=None, additional_headers=None, fees=True):
+        '''Get MBS item code information for a list of codes as a table, with one row per code.
+           Additional columns must be the same length as codes, and are named by additional_headers'''
+        codes = pd.Series(list(codes), dtype=object)
+        table_columns = list(self.MBS_REPORT_COLUMNS)
+        if fees:
+            table_columns += ["Fee", "FeeType"]
+
+        report = self.get_mbs_item_info(codes, table_columns)
+        missing = report["Description"].isna()
+        if missing.any():
+            messages = [f"Item code {code} not in {self.year} dictionary" for code in codes[missing]]
+            report.loc[missing, "CategoryLabel"] = messages
+            report.loc[missing, "Description"] = messages
+            if fees:
+                report.loc[missing, "Fee"] = 500
+                report.loc[missing, "FeeType"] = "Not in dictionary"
+
+        report.insert(len(self.MBS_REPORT_COLUMNS) - 1, "Item", self.normalise_mbs_codes(codes).values)
+        report = report.rename(columns={**self.MBS_REPORT_COLUMNS, "Fee": "Cost"}).reset_index(drop=True)
+        if additional_cols is not None:
+            headers = list(additional_headers or [])
+            headers += [f"Additional {i}" for i in range(len(headers), len(additional_cols))]
+            for header, col in zip(headers, additional_cols):
+                assert len(col) == len(codes)
+                report[header] = list(col)
+
+        return report
+
+    def write_mbs_code_report(self, codes, filename, additional_cols=None, additional_headers=None, fees=True):
+        '''Get MBS item code information for a list of codes and write it in one go.
+           Files ending in .pqt or .parquet are written as parquet, otherwise as CSV with costs formatted in dollars'''
+        report = self.create_mbs_code_report(codes, additional_cols, additional_headers, fees)
+        if Path(filename).suffix in ('.pqt', '.parquet'):
+            report.to_parquet(filename, index=False)
+        else:
+            self.format_mbs_code_report(report).to_csv(filename, index=False)
+
+        return report
+
+    @staticmethod
+    def format_mbs_code_report(report):
+        '''Format costs in an MBS code report as dollar amounts for writing to text'''
+        if "Cost" not in report:
+            return report
+
+        report = report.copy()
+        report["Cost"] = report["Cost"].map("${:.2f}".format).where(report["Cost"].notna(), "")
+
+        return report
+
     def write_mbs_codes_to_csv(self, codes, filename, additional_cols=None, additional_headers=None):
         '''Get MBS item code information and write to a file'''
-        with open(filename, 'w+') as f:
-            header = "Group,Category,Sub-Category,Item,Description,Cost,FeeType"
-            if additional_cols is not None:
-                for col in additional_cols:
-                    assert len(col) == len(codes)
-
-                if additional_headers:
-                    for aheader in additional_headers:
-                        header += f",{aheader}"
-
-            header += "\r\n"
-            f.write(header)
-            for idx, code in enumerate(codes):
-                mod_line = self.get_mbs_code_as_line(code)
-                item_cost, fee_type = self.get_mbs_item_fee(code)
-                item_cost = "${:.2f}".format(item_cost)
-                line = ','.join(mod_line) + f',{item_cost},{fee_type}'
-                if additional_cols is not None:
-                    for col in additional_cols:
-                        line += f",{col[idx]}"
-
-                line += '\r\n'
-                f.write(line)
+        self.write_mbs_code_report(codes, filename, additional_cols, additional_headers)
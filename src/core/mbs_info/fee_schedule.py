@@ -0,0 +1,67 @@
+'''MBS fees across several schedule years'''
+import numpy as np
+import pandas as pd
+from src.core.mbs_info.code_converter import CodeConverter
+
+class MbsFeeSchedule:
+    '''Fees for MBS items from several schedule versions, resolved by date of service.
+       Each schedule gives the fee for an item from its FeeStartDate; a claim is costed at the most recent fee
+       which started on or before the claim date. Claims before every known fee use the earliest fee,
+       and claims without a date use the latest fee'''
+    MBS_DATE_FORMAT = "%d.%m.%Y"
+
+    def __init__(self, years):
+        schedule_years = sorted({CodeConverter.resolve_year(x) for x in years})
+        self.converters = [CodeConverter.get(x) for x in schedule_years]
+        self.fee_table = self.create_fee_table()
+
+    def create_fee_table(self):
+        '''Combine the fees from each schedule into one table sorted by fee start date.
+           Fees without a start date apply from the latest fee start date in their schedule'''
+        frames = []
+        for cdv in self.converters:
+            table = cdv.mbs_item_table
+            start = pd.Series(pd.to_datetime(table["FeeStartDate"].values, format=self.MBS_DATE_FORMAT))
+            start = start.fillna(start.max())
+            frames.append(pd.DataFrame({"Item": table.index.values,
+                                        "FeeStartDate": start.values.astype("datetime64[ns]"),
+                                        "Fee": table["Fee"].values,
+                                        "FeeType": table["FeeType"].values,
+                                        "Schedule": cdv.year}))
+
+        fees = pd.concat(frames, ignore_index=True)
+        fees["FeeStartDate"] = fees["FeeStartDate"].fillna(pd.Timestamp.min)
+        # the same fee listed in several schedules is kept from the latest schedule
+        fees = fees.sort_values(["FeeStartDate", "Schedule"], kind="stable")
+        fees = fees.drop_duplicates(["Item", "FeeStartDate"], keep="last")
+
+        return fees.reset_index(drop=True)
+
+    def get_mbs_item_fees(self, codes, dates):
+        '''Returns the fee, fee type and schedule year for each claim, aligned with the codes index.
+           Items in no schedule have a fee of 500 and fee type "Not in dictionary", as in CodeConverter'''
+        if not isinstance(codes, pd.Series):
+            codes = pd.Series(codes)
+
+        claims = pd.DataFrame({"Item": CodeConverter.normalise_mbs_codes(codes).values,
+                               "Date": pd.to_datetime(np.asarray(dates), errors="coerce").astype("datetime64[ns]"),
+                               "Position": np.arange(len(codes))})
+        # merge_asof cannot match missing dates, so undated claims are costed as if after every fee started
+        claims["Date"] = claims["Date"].fillna(pd.Timestamp.max)
+        claims = claims.sort_values("Date", kind="stable")
+        fee_columns = ["Fee", "FeeType", "Schedule"]
+        merged = pd.merge_asof(claims, self.fee_table, left_on="Date", right_on="FeeStartDate",
+                               by="Item", direction="backward")
+        early = merged["FeeType"].isna()
+        if early.any():
+            earliest = pd.merge_asof(merged.loc[early, ["Item", "Date", "Position"]], self.fee_table,
+                                     left_on="Date", right_on="FeeStartDate", by="Item", direction="forward")
+            merged.loc[early, fee_columns] = earliest[fee_columns].values
+
+        missing = merged["FeeType"].isna()
+        merged.loc[missing, "Fee"] = 500
+        merged.loc[missing, "FeeType"] = "Not in dictionary"
+        fees = merged.sort_values("Position")[fee_columns]
+        fees.index = codes.index
+
+        return fees
@@ -1,11 +1,13 @@
 '''Tools to label providers and episodes'''
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from src.core.algorithms.graphs.graph_utils import GraphUtils
 from src.core.mbs_info.code_converter import CodeConverter
 
 class EpisodeLabeller:
     def __init__(self, year):
-        self.cdv = CodeConverter(year)
+        self.cdv = CodeConverter.get(year)
         self.surgeon_items = self.cdv.get_mbs_items_in_subgroup("3", "T8", "15")
         self.anaesthetist_items = self.cdv.get_mbs_items_in_group("3", "T10")
 
@@ -55,9 +57,51 @@ class ComponentLabeller:
         component_label_converter[len(component_label_converter)] = None
         self.component_label_converter = component_label_converter
         self.components = components
+        self.component_index = GraphUtils.create_component_index(components)
 
     def label_provider(self, provider_info):
         '''assign a rough label to providers based on items they claim'''
-        closest_component = GraphUtils.identify_closest_component(self.components, provider_info.model_graph)
+        closest_component = GraphUtils.identify_closest_component(self.components,
+                                                                  provider_info.model_graph,
+                                                                  self.component_index)
         provider_info.closest_component = closest_component
         provider_info.provider_label = self.component_label_converter[closest_component]
+
+    def closest_components(self, item_matrix, items):
+        '''find the closest component for each row of a sparse (providers x items) occurrence matrix,
+           with the matrix columns corresponding to items'''
+        n_components = len(self.components)
+        item_rows = []
+        component_cols = []
+        for i, item in enumerate(items):
+            component = self.component_index.get(item, None)
+            if component is not None:
+                item_rows.append(i)
+                component_cols.append(component)
+
+        item_components = sparse.csr_matrix((np.ones(len(item_rows)), (item_rows, component_cols)),
+                                            shape=(len(items), n_components + 1))
+        component_scores = (sparse.csr_matrix(item_matrix) != 0).astype(float) @ item_components
+        component_scores = component_scores.toarray()
+        closest = component_scores.argmax(axis=1) # ties go to the lowest component id
+        closest[component_scores.max(axis=1) == 0] = n_components
+
+        return closest
+
+    def label_providers(self, provider_infos):
+        '''assign rough labels to many providers at once based on items they claim'''
+        provider_infos = list(provider_infos)
+        item_columns = {}
+        rows = []
+        cols = []
+        for i, provider_info in enumerate(provider_infos):
+            for item in GraphUtils.flatten_graph_dict(provider_info.model_graph):
+                rows.append(i)
+                cols.append(item_columns.setdefault(item, len(item_columns)))
+
+        item_matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                        shape=(len(provider_infos), len(item_columns)))
+        closest = self.closest_components(item_matrix, list(item_columns))
+        for provider_info, closest_component in zip(provider_infos, closest.tolist()):
+            provider_info.closest_component = closest_component
+            provider_info.provider_label = self.component_label_converter[closest_component]
@@ -0,0 +1,179 @@
+'''Memory-mapped snapshots of the precomputed MBS item table'''
+import json
+import os
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 3
+MANIFEST_FILE = "manifest.json"
+INDEX_COLUMN = "Item"
+FLOAT_COLUMNS = ["Fee"]
+STRING_DATA = "strings"
+STRING_OFFSETS = "string_offsets"
+
+def describe_sources(source_files):
+    '''size and modification time of the files a snapshot was built from, to detect stale snapshots'''
+    sources = {}
+    for filename in source_files:
+        info = Path(filename).stat()
+        sources[Path(filename).name] = [info.st_size, info.st_mtime_ns]
+
+    return sources
+
+def encode_strings(table, columns):
+    '''convert string columns to indices into a single table of unique strings, with -1 for missing values'''
+    strings = {}
+    encoded = {}
+    for col in columns:
+        encoded[col] = np.array([-1 if x is None or x != x else strings.setdefault(x, len(strings)) for x in table[col]],
+                                dtype=np.int32)
+
+    data = [x.encode('utf-8') for x in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(x) for x in data])
+    encoded[STRING_DATA] = np.frombuffer(b''.join(data), dtype=np.uint8)
+    encoded[STRING_OFFSETS] = offsets
+
+    return encoded
+
+def encode_table(table):
+    '''Arrays for an item table: the item codes in sorted order, float columns as they are,
+       and other columns as codes into a string table'''
+    table = table.sort_index()
+    arrays = {INDEX_COLUMN: np.array([str(x) for x in table.index], dtype=str)}
+    for col in FLOAT_COLUMNS:
+        arrays[col] = table[col].to_numpy(dtype=np.float64)
+
+    arrays.update(encode_strings(table, [x for x in table.columns if x not in FLOAT_COLUMNS]))
+
+    return arrays
+
+class MbsItemStore:
+    '''Read-only item table held as arrays, found by binary search over the sorted item codes.
+       Arrays loaded from a snapshot stay memory-mapped, so processes reading the same snapshot share its pages
+       and strings are only decoded for the items and columns looked up'''
+    def __init__(self, arrays, columns):
+        self.arrays = arrays
+        self.columns = list(columns)
+        self.items = arrays[INDEX_COLUMN]
+        self.string_data = arrays[STRING_DATA]
+        self.string_offsets = arrays[STRING_OFFSETS]
+
+    @classmethod
+    def from_table(cls, table):
+        '''store for a table held in memory, when no snapshot can be written'''
+        return cls(encode_table(table), table.columns)
+
+    def __len__(self):
+        return len(self.items)
+
+    def decode_string(self, i):
+        '''the string for a string table index, or None for -1'''
+        if i < 0:
+            return None
+
+        return bytes(self.string_data[self.string_offsets[i]:self.string_offsets[i + 1]]).decode('utf-8')
+
+    def find_items(self, codes):
+        '''positions of item codes in the store, with -1 for codes which are missing or not in the store'''
+        keys = np.array(['' if x is None else str(x) for x in codes], dtype=str)
+        if len(self.items) == 0 or len(keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self.items, keys), len(self.items) - 1)
+        found = self.items[positions] == keys
+
+        return np.where(found, positions, -1)
+
+    def find_item(self, code):
+        return int(self.find_items([code])[0])
+
+    def get_values(self, col, positions):
+        '''values of a column at positions from find_items, with missing values for -1.
+           Each distinct string is decoded once'''
+        positions = np.asarray(positions, dtype=np.int64)
+        missing = positions < 0
+        values = self.arrays[col][np.where(missing, 0, positions)] if len(self.items) else np.zeros(len(positions))
+        if col in FLOAT_COLUMNS:
+            return np.where(missing, np.nan, values)
+
+        string_ids = np.where(missing, -1, values)
+        uniques, inverse = np.unique(string_ids, return_inverse=True)
+        strings = np.array([self.decode_string(x) for x in uniques] + [None], dtype=object)[:-1]
+
+        return strings[inverse.reshape(-1)]
+
+    def get_item(self, code, columns):
+        '''values of the columns for one item code, or None if it is not in the store'''
+        position = self.find_item(code)
+        if position < 0:
+            return None
+
+        return [self.get_values(col, [position])[0] for col in columns]
+
+    def get_frame(self, positions, columns=None, index=None):
+        '''a table of the columns at positions from find_items'''
+        columns = self.columns if columns is None else list(columns)
+        data = {col: self.get_values(col, positions) for col in columns}
+
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    def to_frame(self):
+        '''the whole item table, decoded'''
+        index = pd.Index(self.items.tolist(), dtype=object)
+
+        return self.get_frame(np.arange(len(self.items)), index=index)
+
+def write_snapshot(table, path, source_files, metadata=None):
+    '''Save the item table as a directory of .npy arrays, with the permissions of the folder it is saved in.
+       The directory is written elsewhere and moved into place so concurrent readers never see a partial snapshot'''
+    path = Path(path)
+    arrays = encode_table(table)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent))
+    try:
+        for name, values in arrays.items():
+            np.save(tmp_path / f"{name}.npy", values)
+
+        manifest = {"version": SNAPSHOT_VERSION,
+                    "sources": describe_sources(source_files),
+                    "columns": list(table.columns),
+                    "n_items": len(table),
+                    "metadata": metadata}
+        with open(tmp_path / MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f)
+
+        if path.exists():
+            shutil.rmtree(path)
+
+        os.replace(tmp_path, path)
+        # mkdtemp creates the directory readable only by its owner, so match the shared data folder instead
+        os.chmod(path, stat.S_IMODE(path.parent.stat().st_mode))
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+def read_snapshot(path, source_files):
+    '''Open an item table saved by write_snapshot as a memory-mapped MbsItemStore.
+       Returns None if there is no snapshot, or it was made by another version or from different source files'''
+    path = Path(path)
+    try:
+        with open(path / MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("sources") != describe_sources(source_files):
+        return None
+
+    names = [INDEX_COLUMN, STRING_DATA, STRING_OFFSETS] + manifest["columns"]
+    try:
+        arrays = {x: np.load(path / f"{x}.npy", mmap_mode='r') for x in names}
+    except (OSError, ValueError):
+        return None
+
+    return MbsItemStore(arrays, manifest["columns"])
@@ -1,29 +1,89 @@
+'''Build the MBS item files used by CodeConverter from MBS schedule XML releases'''
+import argparse
 from pathlib import Path
 import pickle
 import xml.etree.ElementTree as ET
+from src.core.mbs_info.code_converter import CodeConverter
 
+REQUIRED_FIELDS = ["Category", "Group", "FeeType", "Description"]
+FEE_TYPES = {"N": "ScheduleFee", "D": "DerivedFee"}
+
+def iterate_xml_items(filename):
+    '''Stream item records from an MBS schedule XML file.
+       Each record is cleared once read, so memory use does not grow with the size of the schedule'''
+    depth = 0
+    root = None
+    for event, element in ET.iterparse(filename, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+
+        fields = list(element)
+        item = fields[0].text
+        if fields[1].text is not None:
+            item = item + '_' + fields[1].text
+
+        yield item, {x.tag: x.text for x in fields[2:]}
+        root.clear()
+
+def validate_item(item, info):
+    '''Raise a ValueError if an item record is missing information CodeConverter relies on'''
+    missing = [x for x in REQUIRED_FIELDS if info.get(x) is None]
+    if missing:
+        raise ValueError(f"Item {item} is missing {', '.join(missing)}")
+
+    fee_type = info["FeeType"]
+    if fee_type not in FEE_TYPES:
+        raise ValueError(f"Item {item} has unknown fee type {fee_type}")
+
+    fee_field = FEE_TYPES[fee_type]
+    fee = info.get(fee_field)
+    if fee is None:
+        raise ValueError(f"Item {item} has fee type {fee_type} but no {fee_field}")
+
+    if fee_type == "N":
+        try:
+            float(fee)
+        except ValueError as e:
+            raise ValueError(f"Item {item} has schedule fee {fee} which is not a number") from e
+
+def read_xml(filename):
+    '''Read and validate every item in an MBS schedule XML file'''
+    mbs = {}
+    for item, info in iterate_xml_items(filename):
+        if item in mbs:
+            raise ValueError(f"Item {item} appears more than once in {filename}")
+
+        validate_item(item, info)
+        mbs[item] = info
+
+    if not mbs:
+        raise ValueError(f"No items found in {filename}")
+
+    return mbs
 
 def convert_xml(x, year):
+    '''Build the item dictionary and item store for a schedule year from an MBS XML release.
+       The store is a versioned snapshot of CodeConverter's item table, which it opens without unpickling'''
     path = Path(__file__).parent
-    tree = ET.parse(f"{path}/{x}")
-    root = tree.getroot()
-    mbs = {}
-    for child in root:
-        item = child[0].text
-        if child[1].text is not None:
-            item = item + '_' + child[1].text
-        mbs[item] = {}
-        for i in range(2, len(child)):
-            key = child[i].tag
-            val = child[i].text
-            mbs[item][key] = val
-
-    with open(f'{path}/MBS_{year}.pkl', 'wb') as f:
+    mbs = read_xml(path / x)
+    with open(path / f'MBS_{year}.pkl', 'wb') as f:
         pickle.dump(mbs, f, pickle.HIGHEST_PROTOCOL)
 
+    return CodeConverter.build_item_store(year, schedule=Path(x).name)
+
 def convert_groups_txt():
+    '''Convert the MBS group headings text file to the nested dictionary format read by CodeConverter'''
+    path = Path(__file__).parent
     cats = {}
-    with open(f'{path}/mbs_groups.txt') as f:
+    with open(path / 'mbs_groups.txt') as f:
         current_cat = ''
         current_group = ''
         while True:
@@ -36,19 +96,20 @@ def convert_groups_txt():
             key = x[1].replace(':', '').replace('.', '')
             val = ' '.join(x[2:]).replace('\n', '').strip()
             if x[0][0] == 'C':
-                cats[key] = {"Label":val, "Groups": {}}
+                cats[key] = {"Label": val}
                 current_cat = key
             elif x[0][0] == 'G':
-                cats[current_cat]["Groups"][key] = {"Label": val, "SubGroups": {}}
+                cats[current_cat][key] = {"Label": val}
                 current_group = key
             elif x[0][0] == 'S':
-                cats[current_cat]["Groups"][current_group]["SubGroups"][key] = val
+                cats[current_cat][current_group][key] = {"Label": val}
 
-    with open(f'utilities/mbs_groups.pkl', 'wb') as f:
+    with open(path / 'mbs_groups.pkl', 'wb') as f:
         pickle.dump(cats, f, pickle.HIGHEST_PROTOCOL)
 
 if __name__ == '__main__':
-    filename = 'MBS.XML-211222.XML'
-    year = '2021'
-    convert_xml(filename, year)
-    # convert_groups_txt()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the MBS item store for a schedule year")
+    parser.add_argument("filename", help="MBS XML file in the mbs_info folder, e.g. MBS.XML-211222.XML")
+    parser.add_argument("year", help="schedule year, e.g. 2021")
+    args = parser.parse_args()
+    convert_xml(args.filename, args.year)
@@ -1,4 +1,6 @@
+import tempfile
 import unittest
+from pathlib import Path
 from datetime import datetime as dt
 import pandas as pd
 
@@ -9,6 +11,7 @@ import src.core.io.config as hc
 from src.analyses.sequence_detection.shared.containers.patient_from_claims import ClaimsPatient
 from src.analyses.sequence_detection.shared.containers.patient_from_lpp import LppPatient
 from src.analyses.sequence_detection.shared.containers.patient_local_patterns import PatientLocalPatterns
+from src.analyses.sequence_detection.shared.lpp_shards import LppShardStore
 from src.core.algorithms.sequence.date_map import DateMap
 from src.core.algorithms.sequence.merger import MergeParameters
 from src.core.mbs_info.code_converter import CodeConverter
@@ -109,3 +112,67 @@ class SequenceContainersTest(unittest.TestCase):
                 for j, val in enumerate(final_seq[i]):
                     self.assertEqual(val, course.item_sequence.sequence[j])
 
+
+        # patients mined together give the same patterns as patients mined individually
+        patients = [("test_x", x) for x in [self.mock_patient_1, self.mock_patient_2, self.mock_patient_3]]
+        for plp, batch_plp in zip(plps, PatientLocalPatterns.create_batch(patients, test_parameters)):
+            self.assertEqual(plp.final_timestamps, batch_plp.final_timestamps)
+            self.assertEqual(plp.final_patterns, batch_plp.final_patterns)
+
+        # patients mined in chunks by a process pool give the same patterns
+        for n_processes in [0, 2]:
+            parallel_plps = PatientLocalPatterns.create_parallel(patients, test_parameters, n_processes, patients_per_chunk=2)
+            for plp, parallel_plp in zip(plps, parallel_plps):
+                self.assertEqual(plp.all_timestamps, parallel_plp.all_timestamps)
+                self.assertEqual(plp.final_timestamps, parallel_plp.final_timestamps)
+                self.assertEqual(plp.final_patterns, parallel_plp.final_patterns)
+
+    def test_lpp_shards(self):
+        test_parameters = MergeParameters()
+        test_parameters.max_period = 2
+        test_parameters.max_spill = 0
+        test_parameters.min_duration = 1
+        patients = []
+        for i, pat in enumerate([self.mock_patient_1, self.mock_patient_2, self.mock_patient_3]):
+            get_ontology_information(pat, cdv, "3_T2")
+            patients.append((f"test_{i}", pat))
+
+        expected = PatientLocalPatterns.create_batch(patients, test_parameters)
+        key = LppShardStore.create_key([x for x, _ in patients], test_parameters, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            # a run which stops after the first chunk
+            store = LppShardStore(directory)
+            self.assertEqual(store.prepare(key), set())
+            chunks = PatientLocalPatterns.iterate_parallel(patients, test_parameters, 0, patients_per_chunk=2)
+            store.write_shard(*next(chunks))
+            self.assertFalse(store.is_complete())
+
+            # a restart mines only the unfinished chunk
+            store = LppShardStore(directory)
+            finished = store.prepare(key)
+            self.assertEqual(finished, {0})
+            chunks = list(PatientLocalPatterns.iterate_parallel(patients, test_parameters, 0, patients_per_chunk=2, skip_chunks=finished))
+            self.assertEqual([x for x, _ in chunks], [2])
+            store.write_shard(*chunks[0])
+            self.assertTrue(LppShardStore(directory).is_complete())
+
+            test = [x for shard in LppShardStore(directory).iterate_shards() for x in shard]
+            self.assertEqual([x.id for x in test], [x.id for x in expected])
+            for plp, shard_plp in zip(expected, test):
+                self.assertEqual(plp.final_timestamps, shard_plp.final_timestamps)
+                self.assertEqual(plp.final_patterns, shard_plp.final_patterns)
+
+            # shards mined with other parameters are refused and kept
+            test_parameters.max_period = 3
+            store = LppShardStore(directory)
+            with self.assertRaises(ValueError):
+                store.prepare(LppShardStore.create_key([x for x, _ in patients], test_parameters, 2))
+
+            self.assertTrue(LppShardStore(directory).is_complete())
+            self.assertEqual(len(list(store.iterate_shards())), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(LppShardStore.find_legacy_file(directory))
+            legacy = Path(directory) / "patient_lpps.pkl.pkl"
+            legacy.write_bytes(b"")
+            self.assertEqual(LppShardStore.find_legacy_file(directory), legacy)
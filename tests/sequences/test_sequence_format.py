@@ -1,10 +1,12 @@
 '''Test cases for sequence mining'''
 import unittest
 from datetime import datetime as dt
+import numpy as np
 import pandas as pd
 from src.core.io.file_utils import FileUtils
 FileUtils.update_config('./config.json')
 
+from src.core.algorithms.sequence.date_map import DateMap
 from src.core.algorithms.sequence.format import FormatSpmf
 from src.core.algorithms.sequence.sequence import SequentialPatternDetection as SPD
 import src.core.io.config as hc
@@ -29,6 +31,51 @@ class SequenceCreationTest(unittest.TestCase):
             for i, test_val in enumerate(test):
                 self.assertEqual(test_val, expected[i])
 
+    def test_construct_sequences(self):
+        second = self.test_data.copy()
+        second[hc.DATE] = second[hc.DATE] + pd.Timedelta(days=3)
+        second.loc[0, hc.ITEM] = '5'
+        data = pd.concat([second, self.test_data], ignore_index=True)
+        groups = [1] * len(second) + [0] * len(self.test_data)
+        ret = FormatSpmf.construct_sequences(data, groups, ["first", "second", "empty"])
+        self.assertEqual(ret.offsets.tolist(), [0, 8, 16, 16])
+        self.assertEqual(len(ret), 3)
+        expected_costs = [20, 70, 10, 20, 20, 30, 30, 30]
+        # each group's timestamps count from its own first day, so the shifted dates give the same timestamps
+        expected_timestamps = [1, 2, 3, 4, 7, 8, 16, 24]
+        for i, expected_sequence in enumerate([['1', '2 4', '3', '1', '1', '2', '2', '2'],
+                                               ['5', '2 4', '3', '1', '1', '2', '2', '2']]):
+            test = ret[i]
+            self.assertEqual(test.identifier, ["first", "second"][i])
+            self.assertEqual(list(test.sequence), expected_sequence)
+            self.assertEqual(test.timestamps.tolist(), expected_timestamps)
+            self.assertEqual(test.costs.tolist(), expected_costs)
+            self.assertEqual(test.get_day_items(), [tuple(x.split(' ')) for x in expected_sequence])
+
+        self.assertEqual(ret.items.tolist(), ['1', '2', '3', '4', '5'])
+        self.assertEqual(len(ret[2].sequence), 0)
+
+        # with a shared origin the shifted dates start three days later
+        origins = np.array([dt(2021, 1, 2)] * 3, dtype="datetime64[D]")
+        ret = FormatSpmf.construct_sequences(data, groups, ["first", "second", "empty"], origins=origins)
+        self.assertEqual(ret[0].timestamps.tolist(), expected_timestamps)
+        self.assertEqual(ret[1].timestamps.tolist(), [x + 3 for x in expected_timestamps])
+
+    def test_date_map(self):
+        date_map = DateMap(self.test_data[hc.DATE])
+        timestamps = date_map.get_timestamps_from_dates(self.test_data[hc.DATE])
+        self.assertEqual(timestamps.dtype, np.int32)
+        self.assertEqual(timestamps.tolist(), [1, 2, 2, 4, 3, 7, 8, 16, 24])
+        self.assertEqual([date_map.get_timestamp_from_date(x) for x in self.test_data[hc.DATE]], timestamps.tolist())
+        dates = date_map.get_dates_from_timestamps(timestamps)
+        self.assertTrue((dates == pd.to_datetime(self.test_data[hc.DATE]).values).all())
+        self.assertEqual(date_map.get_date_from_timestamp(16), pd.Timestamp(2021, 1, 17))
+
+        # date maps pickled as dictionaries of dates are converted to offsets when loaded
+        old = DateMap.__new__(DateMap)
+        old.__setstate__({"map": {pd.Timestamp(2021, 1, 3): 1, pd.Timestamp(2021, 1, 5): 3}, "reversed_map": {}})
+        self.assertEqual(old.get_timestamp_from_date(dt(2021, 1, 5)), 3)
+
     def test_spmf_standard(self):
         sequence = FormatSpmf.construct_sequence(self.test_data, "testing").sequence
         sequences = [sequence, sequence, sequence]
@@ -38,6 +85,13 @@ class SequenceCreationTest(unittest.TestCase):
         for i, test_val in enumerate(test):
             self.assertEqual(test_val, expected[i])
 
+        construct = FormatSpmf.construct_sequence(self.test_data, "testing")
+        n_days = len(construct.sequence)
+        item_codes = list(construct.item_codes) * 3
+        day_offsets = [0] + [x + n * construct.day_offsets[-1] for n in range(3) for x in construct.day_offsets[1:]]
+        test = FormatSpmf.convert_codes_to_spmf_standard(item_codes, day_offsets, [0, n_days, 2 * n_days, 3 * n_days], construct.items)
+        self.assertEqual(test, expected)
+
     def test_spmf_episode(self):
         construct = FormatSpmf.construct_sequence(self.test_data, "testing")
         sequence = construct.sequence
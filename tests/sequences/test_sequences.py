@@ -1,7 +1,165 @@
 '''Test cases for sequence mining'''
+import math
+import os
+import random
 import unittest
+from copy import deepcopy
+from itertools import combinations
+import pandas as pd
 from src.core.algorithms.sequence.merger import Merger
+from src.core.algorithms.sequence.miners import CmSpam, LppGrowth, MiningBackend
 from src.core.algorithms.sequence.sequence import SequentialPatternDetection as SPD
+from src.core.algorithms.sequence.spmf_batch import SpmfBatch
+
+def scan_merge_initiator(initiator_dates, timestamps, max_interval, drop_no_initiator=True):
+    '''reference implementation of Merger.merge_initiator, rescanning every timestamp for each initiator'''
+    timestamps = deepcopy(timestamps)
+    has_init = set()
+    for init_date in sorted(initiator_dates):
+        prior = []
+        during = []
+        for j, tup in enumerate(timestamps):
+            difference_beginning = tup[0] - init_date
+            difference_end = tup[1] - init_date
+            if difference_beginning > 0 and difference_beginning <= max_interval:
+                prior.append(j)
+            elif difference_end >= 0 and difference_beginning <=0:
+                during.append(j)
+
+        has_init.update(prior)
+        has_init.update(during)
+        if not prior and not during:
+            continue
+
+        if sum([len(prior), len(during)]) > 1:
+            idxs = set(prior + during)
+            mins = min([init_date] + [timestamps[j][0] for j in idxs])
+            maxs = max([init_date] + [timestamps[j][1] for j in idxs])
+            for j in sorted(idxs, reverse=True):
+                del timestamps[j]
+                has_init.remove(j)
+
+            new_timestamp = tuple([mins, maxs])
+            timestamps.append(new_timestamp)
+            timestamps.sort()
+            has_init.add(timestamps.index(new_timestamp))
+        elif prior:
+            timestamps[prior[0]] = tuple([init_date, timestamps[prior[0]][1]])
+
+    if drop_no_initiator:
+        remove =  set(range(len(timestamps))) - has_init
+        for j in sorted(remove, reverse=True):
+            del timestamps[j]
+
+    return timestamps
+
+def scan_remove_non_maximal_patterns(patterns, timestamps=None):
+    '''reference implementation of remove_non_maximal_patterns, comparing every pattern with every superset'''
+    drop_indices = []
+    supersets = [x for x in patterns if len(x) > 1]
+    if supersets:
+        for i, p in enumerate(patterns):
+            for s in supersets:
+                if p < s:
+                    drop_indices.append(i)
+                    break
+
+    for i in reversed(drop_indices):
+        del patterns[i]
+        if timestamps is not None:
+            del timestamps[i]
+
+def scan_combine_overlapping(patterns, timestamps, tolerance=0):
+    '''reference implementation of combine_overlapping_timestamped_patterns, merging each timestamp in turn'''
+    patterns = [set(x) for x in patterns]
+    if not patterns:
+        return [], []
+
+    timestamps, patterns = (list(t) for t in zip(*sorted(zip(timestamps, patterns), key=lambda x: x[0])))
+    reduced_stamps = [list(timestamps[0])]
+    reduced_patterns = [patterns[0]]
+    for current, pattern in zip(timestamps[1:], patterns[1:]):
+        previous = reduced_stamps[-1]
+        if SPD.check_overlap(previous[0], previous[1], current[0], current[1], tol=tolerance):
+            previous[1] = max(current[1], previous[1])
+            reduced_patterns[-1].update(pattern)
+        else:
+            reduced_stamps.append(list(current))
+            reduced_patterns.append(pattern)
+
+    return [tuple(sorted(x)) for x in reduced_patterns], [tuple(x) for x in reduced_stamps]
+
+def enumerate_sequential_patterns(sequences, min_support, min_length, max_length, max_gap=None):
+    '''reference for CmSpam.mine, extending patterns one item at a time and counting support by matching each sequence'''
+    itemsets = [[set(day.split(' ')) for day in seq] for seq in sequences]
+    items = sorted({x for seq in itemsets for day in seq for x in day})
+
+    def occurs(pattern, seq, j=0, previous=-1):
+        last = len(seq) if max_gap is None or j == 0 else min(len(seq), previous + max_gap + 1)
+        for position in range(previous + 1, last):
+            if set(pattern[j]) <= seq[position] and (j == len(pattern) - 1 or occurs(pattern, seq, j + 1, position)):
+                return True
+
+        return False
+
+    patterns = {}
+    def extend(pattern, length):
+        sids = [i for i, seq in enumerate(itemsets) if occurs(pattern, seq)]
+        if len(sids) < min_support:
+            return
+
+        if length >= min_length:
+            patterns[pattern] = (len(sids), sids)
+
+        if length == max_length:
+            return
+
+        for item in items:
+            extend(pattern + ((item,),), length + 1)
+            if item > pattern[-1][-1]:
+                extend(pattern[:-1] + (pattern[-1] + (item,),), length + 1)
+
+    for item in items:
+        extend(((item,),), 1)
+
+    return patterns
+
+def enumerate_local_periodic_itemsets(sequence, timestamps, max_period, min_duration, max_spill):
+    '''reference for LppGrowth.mine, checking every itemset of the items in the sequence'''
+    days = [set(x.split(' ')) for x in sequence]
+    items = sorted(set().union(*days))
+    end = timestamps[-1] if timestamps else None
+    patterns = {}
+    for size in range(1, len(items) + 1):
+        for itemset in combinations(items, size):
+            stamps = [t for day, t in zip(days, timestamps) if set(itemset) <= day]
+            intervals = []
+            start = None
+            spillover = 0
+            # the end of the sequence is checked as one more period after the last timestamp
+            for i in range(1, len(stamps) + 1):
+                period = (stamps[i] if i < len(stamps) else end) - stamps[i - 1]
+                if start is None:
+                    if i == len(stamps) or period > max_period:
+                        continue
+
+                    start = stamps[i - 1]
+                    spillover = max_spill
+
+                spillover = max(0, spillover + period - max_period)
+                if spillover <= max_spill and i < len(stamps):
+                    continue
+
+                interval_end = end if spillover <= max_spill else stamps[i - 1]
+                if interval_end - start >= min_duration:
+                    intervals.append((start, interval_end))
+
+                start = None
+
+            if intervals:
+                patterns[itemset] = intervals
+
+    return patterns
 
 class SequenceMergeTest(unittest.TestCase):
     def setUp(self):
@@ -71,4 +229,221 @@ class SequenceMergeTest(unittest.TestCase):
                 expected = expecteds[i]
                 self.assertEqual(len(test), len(expected))
                 for j, x in enumerate(test):
-                    self.assertEqual(x, expected[j])
\ No newline at end of file
+                    self.assertEqual(x, expected[j])
+
+    def test_merge_initiators_equivalence(self):
+        '''random initiators and combined patterns give the same courses as rescanning for each initiator'''
+        rng = random.Random(0)
+        for _ in range(2000):
+            n_patterns = rng.randint(0, 8)
+            starts = [rng.randint(1, 60) for _ in range(n_patterns)]
+            stamps = [(x, x + rng.randint(0, 6)) for x in starts]
+            patterns = [(str(i),) for i in range(n_patterns)]
+            _, timestamps = SPD.combine_overlapping_timestamped_patterns(patterns, stamps, tolerance=rng.randint(0, 3))
+            initiators = [rng.randint(1, 70) for _ in range(rng.randint(0, 6))]
+            max_interval = rng.randint(0, 10)
+            for drop in [True, False]:
+                expected = scan_merge_initiator(initiators, timestamps, max_interval, drop_no_initiator=drop)
+                test = Merger.merge_initiator(initiators, timestamps, max_interval, drop_no_initiator=drop)
+                self.assertEqual(test, expected, (initiators, timestamps, max_interval, drop))
+
+    def test_combine_overlapping_equivalence(self):
+        '''random timestamped patterns are combined as by merging each timestamp in turn'''
+        rng = random.Random(1)
+        for _ in range(1000):
+            n_patterns = rng.randint(0, 12)
+            starts = [rng.randint(1, 80) for _ in range(n_patterns)]
+            stamps = [(x, x + rng.randint(0, 10)) for x in starts]
+            patterns = [tuple(rng.sample("abcdefgh", rng.randint(1, 3))) for _ in range(n_patterns)]
+            tolerance = rng.randint(0, 4)
+            expected = scan_combine_overlapping(patterns, stamps, tolerance=tolerance)
+            test = SPD.combine_overlapping_timestamped_patterns(patterns, stamps, tolerance=tolerance)
+            self.assertEqual(test, expected, (patterns, stamps, tolerance))
+
+    def test_remove_non_maximal_equivalence(self):
+        '''random patterns keep the same maximal patterns and timestamps as comparing every pair'''
+        rng = random.Random(2)
+        items = [str(x) for x in range(20)]
+        for _ in range(1000):
+            n_patterns = rng.randint(0, 12)
+            max_size = rng.choice([3, 16])
+            patterns = [set(rng.sample(items, rng.randint(1, max_size))) for _ in range(n_patterns)]
+            patterns += [set(rng.sample(sorted(x), rng.randint(1, len(x)))) for x in patterns[:3]]
+            timestamps = [(i, i + 1) for i in range(len(patterns))]
+            expected_patterns, expected_timestamps = deepcopy(patterns), deepcopy(timestamps)
+            scan_remove_non_maximal_patterns(expected_patterns, expected_timestamps)
+            SPD.remove_non_maximal_patterns(patterns, timestamps)
+            self.assertEqual(patterns, expected_patterns)
+            self.assertEqual(timestamps, expected_timestamps)
+
+def spmf_available():
+    '''SPMF needs java and the spmf.jar executable, in the working directory or the spmf package'''
+    import shutil
+    import spmf
+    jar_locations = [os.path.join('.', 'spmf.jar'), os.path.join(os.path.dirname(os.path.realpath(spmf.__file__)), 'spmf.jar')]
+
+    return shutil.which('java') is not None and any(os.path.isfile(x) for x in jar_locations)
+
+class PatternMiningTest(unittest.TestCase):
+    '''Test cases for the in-process pattern miners'''
+    def setUp(self):
+        self.sequences = [['1', '1 2 3', '1 3', '4', '3 6'],
+                          ['1 4', '3', '2 3', '1 5'],
+                          ['5 6', '1 2', '4 6', '3', '2'],
+                          ['5', '7', '1 6', '3', '2', '3']]
+        self.args = ["50%", 1, 3, "", 1, True]
+
+    def test_cm_spam(self):
+        result = SPD.mine_spam(self.sequences, self.args)
+        patterns = {'_'.join(x): (y, z) for x, y, z in result[["pattern", "sup", "sid"]].values}
+        self.assertEqual(patterns['1'], (4, ['0', '1', '2', '3']))
+        self.assertEqual(patterns['1 2'], (2, ['0', '2']))
+        # 1 is followed by 3 in every sequence, but only in the next itemset in three of them
+        self.assertEqual(patterns['1_3'], (3, ['0', '1', '3']))
+        self.assertNotIn('1_2_3', patterns)
+        self.assertTrue(all(sum(len(x.split(' ')) for x in y) <= 3 for y in result['pattern']))
+
+        no_gap = SPD.mine_spam(self.sequences, ["50%", 1, 3, "", 10, False])
+        patterns = {'_'.join(x): y for x, y in no_gap.values}
+        self.assertEqual(patterns['1_3'], 4)
+        self.assertEqual(patterns['1_2_3'], 2)
+        self.assertEqual(list(no_gap.columns), ["pattern", "sup"])
+
+    def test_lpp_growth(self):
+        sequence = ['1', '2 4', '1 2', '1', '1 2', '3', '2']
+        timestamps = [1, 2, 3, 5, 6, 9, 15]
+        patterns, intervals = SPD.mine_local_periodic_patterns(sequence, timestamps, 2, 2, 0)
+        found = sorted(zip([tuple(sorted(x)) for x in patterns], intervals))
+        self.assertEqual(found, [(('1',), (1, 6))])
+
+        # a spillover of one day lets 2 continue from 3 to 6
+        patterns, intervals = SPD.mine_local_periodic_patterns(sequence, timestamps, 2, 2, 1)
+        found = dict(zip([tuple(sorted(x)) for x in patterns], intervals))
+        self.assertEqual(found[('2',)], (2, 6))
+        # 1 and 2 are together on 3 and 6, so their interval only opens once periods of 3 are allowed
+        self.assertNotIn(('1', '2'), found)
+        patterns, intervals = SPD.mine_local_periodic_patterns(sequence, timestamps, 3, 2, 1)
+        found = dict(zip([tuple(sorted(x)) for x in patterns], intervals))
+        self.assertEqual(found[('1', '2')], (3, 6))
+
+        # 1 runs to the end of the sequence, while 2 is not periodic until 6
+        sequence = ['1 2', '1', '1', '2', '2 3']
+        patterns, intervals = SPD.mine_local_periodic_patterns(sequence, [1, 2, 4, 6, 7], 2, 1, 3)
+        found = sorted(zip([tuple(sorted(x)) for x in patterns], intervals))
+        self.assertEqual(found, [(('1',), (1, 7)), (('2',), (6, 7))])
+
+    def test_batch(self):
+        jobs = [(self.sequences, self.args), (self.sequences[:2], ["25%", 1, 2, "", 2, False])]
+        for (sequences, args), result in zip(jobs, SPD.mine_spam_batch(jobs)):
+            pd.testing.assert_frame_equal(result, SPD.mine_spam(sequences, args))
+
+        episodes = [(['1', '1 2', '1', '2'], [1, 2, 3, 4]), (['3', '3'], [1, 20])]
+        results = SPD.mine_local_periodic_patterns_batch(episodes, 1, 1, 0)
+        self.assertEqual(results[0], SPD.mine_local_periodic_patterns(*episodes[0], 1, 1, 0))
+        self.assertEqual(results[1], ([], []))
+
+    def test_cm_spam_enumeration(self):
+        '''random sequences give the patterns, supports and sequences found by extending and matching every pattern'''
+        rng = random.Random(3)
+        for _ in range(300):
+            sequences = [[' '.join(sorted(rng.sample("abcde", rng.randint(1, 3)))) for _ in range(rng.randint(1, 6))]
+                         for _ in range(rng.randint(1, 6))]
+            min_support = rng.choice([0.2, 0.4, 0.6])
+            min_length = rng.randint(1, 2)
+            max_length = rng.randint(1, 4)
+            max_gap = rng.choice([None, 1, 2, 3])
+            miner = CmSpam(min_support, min_length=min_length, max_length=max_length, max_gap=max_gap)
+            test = {x: (y, z) for x, y, z in miner.mine(sequences)}
+            expected = enumerate_sequential_patterns(sequences, max(1, math.ceil(min_support * len(sequences))),
+                                                     min_length, max_length, max_gap)
+            self.assertEqual(test, expected, (sequences, min_support, min_length, max_length, max_gap))
+
+    def test_lpp_growth_enumeration(self):
+        '''random sequences give the intervals found by checking every itemset'''
+        rng = random.Random(4)
+        for _ in range(300):
+            n_days = rng.randint(1, 12)
+            sequence = [' '.join(sorted(rng.sample("abcde", rng.randint(1, 3)))) for _ in range(n_days)]
+            timestamps = sorted(rng.sample(range(1, 40), n_days))
+            max_period, min_duration, max_spill = rng.randint(1, 5), rng.randint(0, 6), rng.randint(0, 4)
+            miner = LppGrowth(max_period, min_duration, max_spill)
+            test = dict(miner.mine(sequence, timestamps))
+            expected = enumerate_local_periodic_itemsets(sequence, timestamps, max_period, min_duration, max_spill)
+            self.assertEqual(test, expected, (sequence, timestamps, max_period, min_duration, max_spill))
+
+    def test_scratch_directory(self):
+        with SPD.scratch_directory() as first, SPD.scratch_directory() as second:
+            self.assertNotEqual(first, second)
+            self.assertTrue(first.startswith(SPD.get_scratch_root()))
+            SPD.write_input_file(first, "1 -1 -2")
+
+        self.assertFalse(os.path.exists(first))
+        with self.assertRaises(RuntimeError):
+            with SPD.scratch_directory() as scratch:
+                raise RuntimeError("failed run")
+
+        self.assertFalse(os.path.exists(scratch))
+
+    @unittest.skipUnless(spmf_available(), "SPMF is not available")
+    def test_spmf_parity(self):
+        '''the in-process miners find the same patterns as SPMF, including gap constraints which
+           keep pattern items apart and intervals which run to the end of the sequence'''
+        rng = random.Random(5)
+        spam_cases = [(self.sequences, self.args), (self.sequences, ["25%", 1, 4, "", 2, True]),
+                      (self.sequences, ["75%", 2, 2, "", 1, True])]
+        for _ in range(40):
+            sequences = [[' '.join(sorted(rng.sample("12345", rng.randint(1, 3)))) for _ in range(rng.randint(1, 6))]
+                         for _ in range(rng.randint(1, 6))]
+            spam_cases.append((sequences, [rng.choice(["20%", "40%", "60%"]), rng.randint(1, 2), rng.randint(1, 4),
+                                           "", rng.choice([1, 2, 3]), True]))
+
+        for sequences, args in spam_cases:
+            native = SPD.mine_spam(sequences, args, backend=MiningBackend.PYTHON)
+            reference = SPD.mine_spam(sequences, args, backend=MiningBackend.SPMF)
+            native = {'_'.join(x): (y, sorted(z)) for x, y, z in native[["pattern", "sup", "sid"]].values}
+            reference = {'_'.join(x): (y, sorted(z)) for x, y, z in reference[["pattern", "sup", "sid"]].values}
+            self.assertEqual(native, reference, (sequences, args))
+
+        lpp_cases = [(x, [1, 2, 4, 5, 9, 10][:len(x)], y) for x in self.sequences
+                     for y in [(1, 1, 0), (2, 1, 1), (3, 2, 2)]]
+        lpp_cases.append((['1 2', '1', '1', '2', '2 3'], [1, 2, 4, 6, 7], (2, 1, 3)))
+        for _ in range(40):
+            n_days = rng.randint(1, 12)
+            sequence = [' '.join(sorted(rng.sample("12345", rng.randint(1, 3)))) for _ in range(n_days)]
+            lpp_cases.append((sequence, sorted(rng.sample(range(1, 40), n_days)),
+                              (rng.randint(1, 5), rng.randint(0, 6), rng.randint(0, 4))))
+
+        for sequence, timestamps, (max_period, min_duration, max_spill) in lpp_cases:
+            native = SPD.mine_local_periodic_patterns(sequence, timestamps, max_period, min_duration, max_spill,
+                                                      backend=MiningBackend.PYTHON)
+            reference = SPD.mine_local_periodic_patterns(sequence, timestamps, max_period, min_duration, max_spill,
+                                                         backend=MiningBackend.SPMF)
+            self.assertEqual(sorted((sorted(x), y) for x, y in zip(*native)),
+                             sorted((sorted(x), y) for x, y in zip(*reference)),
+                             (sequence, timestamps, max_period, min_duration, max_spill))
+
+    @unittest.skipUnless(spmf_available(), "SPMF is not available")
+    def test_spmf_batch(self):
+        '''a batch gives the output of each job run alone, in one JVM where java can launch the driver
+           and with one SPMF process per job otherwise'''
+        jobs = [(self.sequences, self.args), (self.sequences[:2], ["25%", 1, 2, "", 2, False]),
+                ([['1'], ['2']], ["100%", 1, 3, "", 1, True])]
+        episodes = [(['1', '1 2', '1', '2'], [1, 2, 4, 5]), (['1 2', '1', '1', '2', '2 3'], [1, 2, 4, 6, 7])]
+        launchable = SpmfBatch.can_launch_driver()
+        try:
+            for driver in sorted({False, launchable}):
+                SpmfBatch.driver_launchable = driver
+                batch = SPD.mine_spam_batch(jobs, backend=MiningBackend.SPMF)
+                for (sequences, args), result in zip(jobs, batch):
+                    reference = SPD.mine_spam(sequences, args, backend=MiningBackend.SPMF)
+                    self.assertEqual(sorted(map(str, result.values.tolist())),
+                                     sorted(map(str, reference.values.tolist())))
+
+                batch = SPD.mine_local_periodic_patterns_batch(episodes, 2, 1, 3, backend=MiningBackend.SPMF)
+                for (sequence, timestamps), result in zip(episodes, batch):
+                    reference = SPD.mine_local_periodic_patterns(sequence, timestamps, 2, 1, 3,
+                                                                 backend=MiningBackend.SPMF)
+                    self.assertEqual(sorted((sorted(x), y) for x, y in zip(*result)),
+                                     sorted((sorted(x), y) for x, y in zip(*reference)))
+        finally:
+            SpmfBatch.driver_launchable = launchable
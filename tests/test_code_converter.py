@@ -1,6 +1,13 @@
 '''tests for MBS/PBS code converter'''
+import pickle
+import tempfile
 import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
 from src.core.mbs_info.code_converter import CodeConverter
+from src.core.mbs_info.mbs_snapshot import read_snapshot, write_snapshot
+from src.core.mbs_info.mbs_xml_converter import read_xml
 
 class TestCodeConverter(unittest.TestCase):
     '''test case class'''
@@ -41,3 +48,91 @@ class TestCodeConverter(unittest.TestCase):
         for key, val in expected.items():
             result = self.cdv.convert_rsp_str(val)
             assert result == key
+
+    def test_vectorised_lookup(self):
+        '''check series lookups match the single item conversions'''
+        codes = pd.Series([113, "32046", 99999999, 113], index=[3, 4, 5, 6])
+        fees = self.cdv.get_mbs_item_fees(codes)
+        labels = self.cdv.convert_mbs_codes_to_ontology_labels(codes)
+        self.assertEqual(list(fees.index), list(codes.index))
+        for idx, code in codes.items():
+            self.assertEqual(tuple(fees.loc[idx]), self.cdv.get_mbs_item_fee(code))
+            self.assertEqual(labels[idx], self.cdv.convert_mbs_code_to_ontology_label(code))
+
+    def test_snapshot(self):
+        '''check the item table survives a snapshot, and snapshots of other sources are not used'''
+        sources = [self.cdv.mbs_item_filename]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "MBS_2019"
+            Path(tmp).chmod(0o755)
+            write_snapshot(self.cdv.mbs_item_table, path, sources)
+            self.assertEqual(path.stat().st_mode & 0o777, 0o755)
+            store = read_snapshot(path, sources)
+            self.assertIsInstance(store.items, np.memmap)
+            self.assertIsInstance(store.arrays["Description"], np.memmap)
+            pd.testing.assert_frame_equal(self.cdv.mbs_item_table, store.to_frame())
+            positions = store.find_items(["32046", "99999999", None, "113"])
+            self.assertEqual(positions[1:3].tolist(), [-1, -1])
+            self.assertEqual(store.get_values("Group", positions).tolist(), ["T8", None, None, "A3"])
+            self.assertEqual(store.get_item("113", ["Category", "SubGroup"]), ["1", None])
+            self.assertIsNone(store.get_item("99999999", ["Category"]))
+            self.assertIsNone(read_snapshot(path, [Path(__file__)]))
+            self.assertIsNone(read_snapshot(Path(tmp) / "missing", sources))
+
+    def test_shared_converter(self):
+        '''check converters are shared per schedule year and pickle by year'''
+        shared = CodeConverter.get(2019)
+        self.assertIs(shared, CodeConverter.get("2019"))
+        self.assertIs(shared, CodeConverter.get(2015))
+        self.assertIs(shared, pickle.loads(pickle.dumps(shared)))
+
+    def test_items_in_hierarchy(self):
+        '''check items are found at each level of the MBS hierarchy'''
+        subgroup = self.cdv.get_mbs_items_in_subgroup(3, "T8", 2)
+        self.assertIsInstance(subgroup, frozenset)
+        self.assertIn("32046", subgroup)
+        self.assertTrue(subgroup <= self.cdv.get_mbs_items_in_group("3", "T8"))
+        self.assertTrue(self.cdv.get_mbs_items_in_group("3", "T8") <= self.cdv.get_mbs_items_in_category(3))
+        self.assertIn("113", self.cdv.get_mbs_items_in_subheading(1, "A3", None, None))
+        self.assertEqual(self.cdv.get_mbs_items_in_group("3", "Z99"), frozenset())
+
+    def test_read_xml(self):
+        '''check schedule XML is streamed into item records and invalid records are rejected'''
+        item = "<Data><ItemNum>{}</ItemNum><SubItemNum>{}</SubItemNum><Category>1</Category><Group>A1</Group>" \
+               "<FeeType>N</FeeType><ScheduleFee>{}</ScheduleFee><Description>test</Description></Data>"
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = Path(tmp) / "MBS.XML"
+            filename.write_text(f"<MBS_XML>{item.format(3, '', '17.50')}{item.format(4, 1, '9.00')}</MBS_XML>")
+            mbs = read_xml(filename)
+            self.assertEqual(list(mbs), ["3", "4_1"])
+            self.assertEqual(mbs["3"]["ScheduleFee"], "17.50")
+            self.assertEqual(mbs["4_1"]["Group"], "A1")
+
+            filename.write_text(f"<MBS_XML>{item.format(3, '', 'free')}</MBS_XML>")
+            self.assertRaises(ValueError, read_xml, filename)
+            filename.write_text(f"<MBS_XML>{item.format(3, '', '1.00')}{item.format(3, '', '1.00')}</MBS_XML>")
+            self.assertRaises(ValueError, read_xml, filename)
+
+    def test_ontology_levels(self):
+        '''check ontology labels can be found at each level of the hierarchy'''
+        codes = pd.Series(["32046", 32046, None])
+        for level, expected in enumerate(["3", "3_T8", "3_T8_2", "3_T8_2_None"], start=1):
+            labels = self.cdv.convert_mbs_codes_to_ontology_labels(codes, level=level)
+            self.assertEqual(labels.dtype, "category")
+            self.assertEqual(labels.tolist()[:2], [expected, expected])
+            self.assertTrue(pd.isna(labels[2]))
+            self.assertEqual(self.cdv.convert_mbs_code_to_ontology_label(32046, level=level), expected)
+
+    def test_code_report(self):
+        '''check reports have a row per code, with fees and additional columns'''
+        codes = [113, "32046", 99999999]
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = Path(tmp) / "report.csv"
+            self.cdv.write_mbs_code_report(codes, filename, [["a", "b", "c"]], ["States"])
+            report = pd.read_csv(filename, dtype=str)
+
+        self.assertEqual(list(report["Item"]), ["113", "32046", "99999999"])
+        self.assertEqual(list(report["Cost"]), ["$66.20", "$759.85", "$500.00"])
+        self.assertEqual(list(report["States"]), ["a", "b", "c"])
+        self.assertEqual(report.loc[1, "Sub-group"], self.cdv.convert_mbs_code_to_group_labels(32046)[2])
+        self.assertEqual(report.loc[2, "Category"], "Item code 99999999 not in 2019 dictionary")
@@ -0,0 +1,35 @@
+'''tests for MBS fees across schedule years'''
+import unittest
+import pandas as pd
+from src.core.mbs_info.code_converter import CodeConverter
+from src.core.mbs_info.fee_schedule import MbsFeeSchedule
+
+class TestFeeSchedule(unittest.TestCase):
+    '''test case class'''
+    def setUp(self):
+        self.fees = MbsFeeSchedule(["2014", "2015", "2021"])
+
+    def test_fee_by_date(self):
+        '''claims are costed at the fee in effect on the date of service'''
+        codes = pd.Series(["23", 23, "23", "99999999"], index=[4, 3, 2, 1])
+        dates = pd.to_datetime(["2015-06-01", "2020-01-01", "2022-01-01", "2015-06-01"])
+        fees = self.fees.get_mbs_item_fees(codes, dates)
+        self.assertEqual(list(fees.index), [4, 3, 2, 1])
+        self.assertEqual(fees.loc[4, "Fee"], CodeConverter.get(2014).get_mbs_item_fee(23)[0])
+        self.assertEqual(fees.loc[3, "Fee"], CodeConverter.get(2019).get_mbs_item_fee(23)[0])
+        self.assertEqual(fees.loc[2, "Fee"], CodeConverter.get(2021).get_mbs_item_fee(23)[0])
+        self.assertEqual((fees.loc[1, "Fee"], fees.loc[1, "FeeType"]), (500, "Not in dictionary"))
+
+    def test_fee_before_schedules(self):
+        '''claims before every listed fee use the earliest fee'''
+        fees = self.fees.get_mbs_item_fees(pd.Series(["23"]), pd.to_datetime(["2001-01-01"]))
+        self.assertEqual(fees.iloc[0]["Fee"], CodeConverter.get(2014).get_mbs_item_fee(23)[0])
+
+    def test_fee_without_date(self):
+        '''claims with missing dates use the latest fee'''
+        codes = pd.Series(["23", "23", "99999999"], index=[7, 8, 9])
+        fees = self.fees.get_mbs_item_fees(codes, pd.to_datetime([None, "2015-06-01", None]))
+        self.assertEqual(list(fees.index), [7, 8, 9])
+        self.assertEqual(fees.loc[7, "Fee"], CodeConverter.get(2021).get_mbs_item_fee(23)[0])
+        self.assertEqual(fees.loc[8, "Fee"], CodeConverter.get(2014).get_mbs_item_fee(23)[0])
+        self.assertEqual((fees.loc[9, "Fee"], fees.loc[9, "FeeType"]), (500, "Not in dictionary"))
@@ -182,3 +182,41 @@ class ComponentLabellerTest(unittest.TestCase):
             labeller.label_provider(provider_info)
             self.assertEqual(provider_info.provider_label, expected)
             test_expected_component(val, provider_info, labeller)
+
+    def test_label_many(self):
+        '''test vectorised labelling matches labelling one provider at a time'''
+        model = {
+            1: {2: {}},
+            3: {4: {}},
+            4: {5: {}, 6: {}},
+            5: {4: {}},
+            8: {9: {}, 10: {}}
+        }
+        graphs = [
+            {1: {}, 2: {}},
+            {4: {}, 5: {}, 8: {}},
+            {1: {}, 2: {}, 4: {}},
+            {1: {}, 4: {}},
+            {7: {}, 8: {}, 9: {}},
+            {11: {}, 12: {}}
+        ]
+        labeller = ComponentLabeller(model, [(4, "A"), (1, "B")], "C")
+
+        @dataclass
+        class ProviderInfo:
+            '''mock provider info class'''
+            closest_component: int = -1
+            provider_label: str = "FAIL"
+            model_graph: dict = None
+
+        singles = [ProviderInfo(model_graph=graph) for graph in graphs]
+        for provider_info in singles:
+            labeller.label_provider(provider_info)
+
+        many = [ProviderInfo(model_graph=graph) for graph in graphs]
+        labeller.label_providers(many)
+        for single, multiple in zip(singles, many):
+            self.assertEqual(single.closest_component, multiple.closest_component)
+            self.assertEqual(single.provider_label, multiple.provider_label)
+
+        self.assertEqual(many[-1].closest_component, len(labeller.components))
@@ -0,0 +1,55 @@
+'''Test cases for the graph render queue'''
+import unittest
+from src.core.io.render_queue import RenderEngine, RenderPolicy, RenderQueue
+
+class MockRenderLogger():
+    '''Mock logger which keeps logged lines'''
+    def __init__(self):
+        self.lines = []
+
+    def log(self, line, line_end=None):
+        '''keep the line'''
+        self.lines.append(line)
+
+def failing_render():
+    '''mock render function which fails'''
+    raise RuntimeError("no layout")
+
+class RenderQueueTest(unittest.TestCase):
+    '''Test cases for RenderQueue and RenderPolicy'''
+    def test_policy_engines(self):
+        '''large graphs should only be saved as DOT text'''
+        policy = RenderPolicy(engines=(RenderEngine.GRAPHVIZ,), max_layout_nodes=3)
+        self.assertEqual(policy.select_engines(3), (RenderEngine.GRAPHVIZ,))
+        self.assertEqual(policy.select_engines(4), (RenderEngine.DOT,))
+        self.assertEqual(RenderPolicy().select_engines(1000), RenderPolicy().engines)
+
+    def test_synchronous_queue(self):
+        '''jobs run immediately without processes, and failures are logged on join'''
+        logger = MockRenderLogger()
+        queue = RenderQueue(logger, 0)
+        rendered = []
+        queue.submit("ok", rendered.append, 1)
+        queue.submit("bad", failing_render)
+        self.assertEqual(rendered, [1])
+        self.assertEqual(len(queue.failures), 1)
+        queue.join()
+        self.assertEqual(len(queue.failures), 0)
+        self.assertTrue(any("Rendering bad failed: RuntimeError: no layout" in x for x in logger.lines))
+
+    def test_time_budget(self):
+        '''renders over budget are reported as failures'''
+        queue = RenderQueue(MockRenderLogger(), 0)
+        queue.submit("slow", sum, [1, 2], time_budget=-1)
+        self.assertEqual(queue.failures[0][0], "slow")
+
+    def test_unpicklable_job(self):
+        '''jobs the pool cannot pickle are logged as failures without stopping the other renders'''
+        logger = MockRenderLogger()
+        queue = RenderQueue(logger, 1)
+        queue.submit("unpicklable", lambda: None)
+        queue.submit("ok", sum, [1, 2])
+        queue.join()
+        self.assertTrue(any(x.startswith("Rendering unpicklable failed") for x in logger.lines))
+        self.assertIn("Rendered ok in", " ".join(logger.lines))
+        self.assertFalse(any(x.startswith("Rendering ok failed") for x in logger.lines))
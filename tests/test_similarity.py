@@ -1,7 +1,8 @@
 '''test similarity algorithms'''
 import unittest
+import pandas as pd
 from math import isclose
-from src.core.algorithms.similarity import average_overlap, rbo, rbo_with_ties, rbo_weight_at_depth
+from src.core.algorithms.similarity import TiedRanking, average_overlap, rbo, rbo_ext, rbo_with_ties, rbo_weight_at_depth, similarity_matrix, get_unchanged_similarities
 
 class TestSimilarity(unittest.TestCase):
     '''test similarity algorithms'''
@@ -40,3 +41,78 @@ class TestSimilarity(unittest.TestCase):
         # note expected values are from the Webber paper
         self.assertTrue(isclose(0.86, rbo_weight_at_depth(0.9, 10), rel_tol=0.01))
         self.assertTrue(isclose(0.86, rbo_weight_at_depth(0.98, 50), rel_tol=0.01))
+        weights = rbo_weight_at_depth(0.9, [1, 10])
+        self.assertTrue(isclose(rbo_weight_at_depth(0.9, 1), weights[0]))
+        self.assertTrue(isclose(rbo_weight_at_depth(0.9, 10), weights[1]))
+
+    def test_rbo_ext(self):
+        '''test extrapolated rbo'''
+        ranking_1 = ["John", "Harry", "Bob"]
+        self.assertTrue(isclose(1, rbo_ext(ranking_1, ranking_1, 0.9)))
+        self.assertTrue(isclose(1, rbo_ext(ranking_1, ranking_1 + ["Lisa", "Morgan"], 0.9)))
+        self.assertEqual(0, rbo_ext(ranking_1, ["Lisa", "Morgan"], 0.9))
+        partial = rbo_ext(ranking_1, ["John", "Lisa", "Morgan", "Bob"], 0.9)
+        self.assertTrue(0 < partial < 1)
+        self.assertEqual(partial, rbo_ext(["John", "Lisa", "Morgan", "Bob"], ranking_1, 0.9))
+
+    def test_similarity_matrix(self):
+        '''test the pairwise similarity matrix'''
+        rankings = [[["John"], ["Lisa", "Morgan"], [], ["Tyler"]],
+                    [["Lisa", "Morgan"], [], ["John"], ["Harry"]],
+                    [["Tyler"], ["John"], ["Lisa"], ["Morgan"]]]
+        labels = ["a", "b", "c"]
+        matrix = similarity_matrix(rankings, labels, n_processes=0, p=0.2)
+        self.assertEqual(list(matrix.index), labels)
+        self.assertAlmostEqual(0.1648, matrix.at["a", "b"], places=8)
+        self.assertEqual(matrix.at["a", "b"], matrix.at["b", "a"])
+        self.assertEqual(matrix.at["c", "c"], rbo_with_ties(rankings[2], rankings[2], 0.2))
+
+        pooled = similarity_matrix(rankings, labels, n_processes=2, p=0.2)
+        self.assertTrue(matrix.equals(pooled))
+
+        previous = matrix.loc[["a", "b"], ["a", "b"]] * 0 + 5
+        reused = similarity_matrix(rankings, labels, previous=previous, p=0.2)
+        self.assertEqual(reused.at["a", "b"], 5)
+        self.assertEqual(reused.at["a", "c"], matrix.at["a", "c"])
+
+    def test_changed_ranking_recomputed(self):
+        '''similarities for a ranking whose content changed are recomputed rather than reused'''
+        rankings = [[["John"], ["Lisa", "Morgan"], [], ["Tyler"]],
+                    [["Lisa", "Morgan"], [], ["John"], ["Harry"]],
+                    [["Tyler"], ["John"], ["Lisa"], ["Morgan"]]]
+        labels = ["a", "b", "c"]
+        versions = {"a": "1", "b": "1", "c": "1"}
+        matrix = similarity_matrix(rankings, labels, p=0.2)
+
+        changed = rankings[:2] + [[["John"], ["Tyler"], ["Morgan"], ["Lisa"]]]
+        new_versions = {"a": "1", "b": "1", "c": "2"}
+        previous, kept_versions = get_unchanged_similarities(matrix, versions, new_versions)
+        self.assertEqual(list(previous.index), ["a", "b"])
+        self.assertEqual(kept_versions, {"a": "1", "b": "1"})
+        recomputed = similarity_matrix(changed, labels, previous=previous, p=0.2)
+        self.assertEqual(recomputed.at["a", "c"], rbo_with_ties(changed[0], changed[2], 0.2))
+        self.assertNotEqual(recomputed.at["a", "c"], matrix.at["a", "c"])
+        self.assertEqual(recomputed.at["a", "b"], matrix.at["a", "b"])
+
+        # labels without a stored version are not trusted, and labels absent from this run are kept
+        previous, kept_versions = get_unchanged_similarities(matrix, {"a": "1", "c": "1"}, {"a": "1"})
+        self.assertEqual(list(previous.index), ["a", "c"])
+        self.assertEqual(get_unchanged_similarities(None, {}, new_versions), (None, {}))
+
+    def test_tied_ranking(self):
+        '''test the compact tied ranking matches the list of lists format'''
+        scores_1 = pd.Series([5, 3, 3, 1], index=["John", "Lisa", "Morgan", "Tyler"])
+        scores_2 = pd.Series([2, 2, 1, 0], index=["Lisa", "Morgan", "John", "Harry"])
+        ranking_1 = TiedRanking.from_series(scores_1)
+        ranking_2 = TiedRanking.from_series(scores_2)
+        self.assertEqual(len(ranking_1), 4)
+        self.assertEqual([sorted(x) for x in ranking_1.tolist()], [["John"], ["Lisa", "Morgan"], [], ["Tyler"]])
+        self.assertEqual(sorted(ranking_2[0]), ["Lisa", "Morgan"])
+        self.assertEqual(ranking_2[1], [])
+        self.assertAlmostEqual(0.1648, rbo_with_ties(ranking_1, ranking_2, 0.2), places=8)
+
+        top = ranking_1[:2]
+        self.assertEqual(len(top), 2)
+        self.assertEqual([sorted(x) for x in top.tolist()], [["John"], ["Lisa", "Morgan"]])
+        self.assertAlmostEqual(rbo_with_ties(top.tolist(), ranking_2[:2].tolist(), 0.2),
+                               rbo_with_ties(top, ranking_2[:2], 0.2), places=12)